@@ -0,0 +1,140 @@
+"""Content-addressed cache for AI responses"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_pool import SQLitePool
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_prompt(text):
+    """Collapse whitespace so formatting differences don't change the cache key"""
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def make_cache_key(model, system_message, prompt):
+    """Hash model, system message and normalized prompt into a cache key"""
+    digest = hashlib.sha256()
+    for part in (model, normalize_prompt(system_message), normalize_prompt(prompt)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache: an in-process LRU in front of an optional SQLite file.
+
+    Entries expire after ``ttl`` seconds in both tiers. The memory tier holds
+    at most ``max_entries`` items and evicts the least recently used; the
+    SQLite tier is pruned to ``disk_max_entries`` by dropping the oldest rows.
+    The SQLite file can be shared by several worker processes on one host.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, max_entries=1024, ttl=7 * 24 * 3600, sqlite_path=None, disk_max_entries=100000,
+                 pool_size=8):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+        self.disk_max_entries = disk_max_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = SQLitePool(sqlite_path, size=pool_size) if sqlite_path else None
+        self._writes_since_prune = 0
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0}
+
+        if sqlite_path:
+            self._pool.execute(
+                'CREATE TABLE IF NOT EXISTS ai_response_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._counters[key] += amount
+
+    def get(self, key, count=True):
+        """Return the cached value for a key, or None; count=False leaves the hit/miss counters alone"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    if count:
+                        self._counters['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+
+        if self.sqlite_path:
+            rows = self._pool.execute('SELECT value, created_at FROM ai_response_cache WHERE key = ?', (key,))
+            row = rows[0] if rows else None
+            if row is not None and row[1] + self.ttl > now:
+                if count:
+                    self._count('disk_hits')
+                self._remember(key, row[0], row[1] + self.ttl)
+                return row[0]
+
+        if count:
+            self._count('misses')
+        return None
+
+    def set(self, key, value):
+        """Store a value in every tier"""
+        now = time.time()
+        self._remember(key, value, now + self.ttl)
+        self._count('sets')
+
+        if self.sqlite_path:
+            with self._pool.connection() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO ai_response_cache (key, value, created_at) VALUES (?, ?, ?)',
+                    (key, value, now)
+                )
+                with self._lock:
+                    self._writes_since_prune += 1
+                    prune = self._writes_since_prune >= self.PRUNE_EVERY
+                    if prune:
+                        self._writes_since_prune = 0
+                if prune:
+                    self._prune(conn, now)
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _prune(self, conn, now):
+        conn.execute('DELETE FROM ai_response_cache WHERE created_at <= ?', (now - self.ttl,))
+        conn.execute(
+            'DELETE FROM ai_response_cache WHERE key IN ('
+            'SELECT key FROM ai_response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+            (self.disk_max_entries,)
+        )
+
+    def clear(self):
+        """Drop every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+        if self.sqlite_path:
+            self._pool.execute('DELETE FROM ai_response_cache')
+
+    def stats(self):
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        if self.sqlite_path:
+            stats['disk_entries'] = self._pool.execute('SELECT COUNT(*) FROM ai_response_cache')[0][0]
+        return stats
@@ -0,0 +1,163 @@
+"""Population analytics from incrementally maintained daily aggregates"""
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, select, update
+
+
+class AssessmentAggregates:
+    """Daily counts of assessments per risk level and per yes-factor.
+
+    ``daily_table`` holds (kind, day, risk_level) -> count, score_sum and
+    ``factor_table`` holds (kind, day, risk_level, factor) -> count. Rows
+    are added with ``record`` in the same transaction as the assessments
+    themselves, so reads never scan the assessment tables. ``rebuild``
+    recomputes everything from scratch for one kind.
+    """
+
+    def __init__(self, daily_table, factor_table):
+        self.daily = daily_table
+        self.factors = factor_table
+
+    def aggregate(self, questionnaire, rows):
+        """Sum (created_at, risk_level, score, answer_mask, schema_version) rows into table deltas"""
+        rows = list(rows)
+        if not rows:
+            return [], []
+        groups = {}
+        index = np.array([
+            groups.setdefault(((created_at or datetime.utcnow()).date(), risk_level), len(groups))
+            for created_at, risk_level, _, _, _ in rows
+        ])
+        masks = np.array([mask for _, _, _, mask, _ in rows], dtype=np.int64)
+        versions = np.array([version for _, _, _, _, version in rows])
+        for version in set(versions.tolist()) - {questionnaire.version}:
+            old = versions == version
+            masks[old] = questionnaire.upgrade_masks(masks[old], version)
+
+        counts = np.bincount(index, minlength=len(groups))
+        score_sums = np.bincount(index, weights=[score for _, _, score, _, _ in rows], minlength=len(groups))
+        factor_counts = np.zeros((len(groups), len(questionnaire.keys)), dtype=np.int64)
+        np.add.at(factor_counts, index, questionnaire.masks_to_matrix(masks))
+
+        daily = []
+        factors = []
+        for (day, risk_level), g in groups.items():
+            daily.append({'kind': questionnaire.name, 'day': day, 'risk_level': risk_level,
+                          'count': int(counts[g]), 'score_sum': int(score_sums[g])})
+            for f in np.flatnonzero(factor_counts[g]):
+                factors.append({'kind': questionnaire.name, 'day': day, 'risk_level': risk_level,
+                                'factor': questionnaire.keys[f], 'count': int(factor_counts[g, f])})
+        return daily, factors
+
+    def record(self, connection, questionnaire, rows):
+        """Add newly inserted assessments to the aggregates"""
+        daily, factors = self.aggregate(questionnaire, rows)
+        self._increment(connection, self.daily, ('kind', 'day', 'risk_level'), ('count', 'score_sum'), daily)
+        self._increment(connection, self.factors, ('kind', 'day', 'risk_level', 'factor'), ('count',), factors)
+
+    def _increment(self, connection, table, keys, counters, rows):
+        if not rows:
+            return
+        dialect = connection.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as upsert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as upsert
+            statement = upsert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={name: table.c[name] + statement.excluded[name] for name in counters}
+            )
+            connection.execute(statement, rows)
+            return
+
+        for row in rows:
+            match = and_(*[table.c[key] == row[key] for key in keys])
+            updated = connection.execute(
+                update(table).where(match).values({name: table.c[name] + row[name] for name in counters})
+            ).rowcount
+            if not updated:
+                connection.execute(insert(table), row)
+
+    def rebuild(self, connection, questionnaire, source, chunk_size=20000):
+        """Recompute one kind's aggregates from its assessment table; returns rows read"""
+        connection.execute(delete(self.daily).where(self.daily.c.kind == questionnaire.name))
+        connection.execute(delete(self.factors).where(self.factors.c.kind == questionnaire.name))
+        query = (
+            select(source.c.id, source.c.created_at, source.c.risk_level, source.c.score,
+                   source.c.answer_mask, source.c.schema_version)
+            .order_by(source.c.id)
+            .limit(chunk_size)
+        )
+        last_id = 0
+        total = 0
+        while True:
+            rows = connection.execute(query.where(source.c.id > last_id)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            total += len(rows)
+            self.record(connection, questionnaire, [row[1:] for row in rows])
+        return total
+
+    def summary(self, connection, questionnaire, since=None):
+        """Risk-level distribution, factor prevalence and daily trend for one kind"""
+        started = time.perf_counter()
+        d, f = self.daily, self.factors
+        where_daily = [d.c.kind == questionnaire.name]
+        where_factors = [f.c.kind == questionnaire.name]
+        if since is not None:
+            where_daily.append(d.c.day >= since)
+            where_factors.append(f.c.day >= since)
+
+        trend = connection.execute(
+            select(d.c.day, d.c.risk_level, func.sum(d.c.count), func.sum(d.c.score_sum))
+            .where(*where_daily).group_by(d.c.day, d.c.risk_level).order_by(d.c.day)
+        ).all()
+        factor_rows = connection.execute(
+            select(f.c.factor, f.c.risk_level, func.sum(f.c.count))
+            .where(*where_factors).group_by(f.c.factor, f.c.risk_level)
+        ).all()
+
+        levels = {}
+        days = {}
+        total = 0
+        score_total = 0
+        for day, risk_level, count, score_sum in trend:
+            levels[risk_level] = levels.get(risk_level, 0) + count
+            entry = days.setdefault(day, {'day': day.isoformat(), 'count': 0, 'score_sum': 0, 'risk_levels': {}})
+            entry['count'] += count
+            entry['score_sum'] += score_sum
+            entry['risk_levels'][risk_level] = count
+            total += count
+            score_total += score_sum
+
+        prevalence = {}
+        for factor, risk_level, count in factor_rows:
+            item = prevalence.setdefault(factor, {'count': 0, 'by_risk_level': {}})
+            item['count'] += count
+            item['by_risk_level'][risk_level] = count
+
+        factors = []
+        for key, question in zip(questionnaire.keys, questionnaire.questions):
+            item = prevalence.get(key, {'count': 0, 'by_risk_level': {}})
+            factors.append({'factor': key, 'question': question, 'count': item['count'],
+                            'rate': item['count'] / total if total else 0.0, 'by_risk_level': item['by_risk_level']})
+        factors.sort(key=lambda item: -item['count'])
+
+        for entry in days.values():
+            entry['average_score'] = entry.pop('score_sum') / entry['count'] if entry['count'] else None
+
+        return {
+            'kind': questionnaire.name,
+            'since': since.isoformat() if since else None,
+            'total': total,
+            'average_score': score_total / total if total else None,
+            'risk_levels': levels,
+            'factors': factors,
+            'trend': list(days.values()),
+            'query_ms': round((time.perf_counter() - started) * 1000, 2),
+        }
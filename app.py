@@ -1,20 +1,41 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash, Response, stream_with_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-import requests
 import json
 import os
-from datetime import datetime
+import re
+import base64
+import click
+import numpy as np
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 import sqlite3
 from dotenv import load_dotenv
+from database import configure_database, GroupCommitWriter
+from jobs import ReportWorkerPool
+from user_cache import UserCache
+from chat_context import ConversationStore
+from llm_client import LLMClient
+from ai_cache import ResponseCache, make_cache_key
+from singleflight import SingleFlight, LockTableFlight
+from medications import parse_medications, medication_pairs
+from scoring import HEART, STROKE, QUESTIONNAIRES, risk_level as risk_level_for, risk_levels, parse_answer
+from report_sections import ReportLibrary
+from rescore import rescore_table
+from migrations import add_column, column_too_narrow, table_columns, upgrade_answer_masks, widen_column
+from passwords import PasswordHasher, HashingUnavailable
+from analytics import AssessmentAggregates
+from export import ExportSource, iter_records, ndjson_chunks, csv_chunks, encode_chunks
+from metrics import Metrics, Registry
+from ratelimit import RateLimiter, MemoryBucketStore, SQLiteBucketStore, FairScheduler, CapacityError, parse_rate
 
 # Load environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('APP_SECRET_KEY')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cardiovision.db'
+configure_database(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize extensions
@@ -27,18 +48,91 @@ login_manager.login_message_category = 'info'
 
 # OpenRouter API configuration
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')  # Set this environment variable
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_BASE_URL = os.getenv('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1/chat/completions")
+OPENROUTER_MODEL = os.getenv('OPENROUTER_MODEL', "deepseek/deepseek-r1:free")
+
+# Shared keep-alive client: pooled connections, timeouts, retries and a circuit breaker
+llm_client = LLMClient(
+    OPENROUTER_BASE_URL,
+    OPENROUTER_API_KEY,
+    OPENROUTER_MODEL,
+    connect_timeout=float(os.getenv('LLM_CONNECT_TIMEOUT', '5')),
+    read_timeout=float(os.getenv('LLM_READ_TIMEOUT', '60')),
+    max_retries=int(os.getenv('LLM_MAX_RETRIES', '2')),
+    pool_size=int(os.getenv('LLM_POOL_SIZE', '20')),
+    failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', '5')),
+    reset_timeout=float(os.getenv('LLM_BREAKER_RESET', '30'))
+)
+
+# Cache for deterministic prompts (assessment reports); AI_CACHE_DB enables the shared SQLite tier
+ai_cache = ResponseCache(
+    max_entries=int(os.getenv('AI_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('AI_CACHE_TTL', str(7 * 24 * 3600))),
+    sqlite_path=os.getenv('AI_CACHE_DB') or None,
+    disk_max_entries=int(os.getenv('AI_CACHE_DB_MAX_ENTRIES', '100000'))
+)
+
+# Identical cacheable prompts in flight at the same time share one upstream call. With AI_CACHE_DB
+# set, a lock table in the same file extends this across worker processes, which read the
+# leader's result from the shared cache tier.
+llm_flight = SingleFlight(
+    LockTableFlight(
+        os.getenv('AI_CACHE_DB'),
+        lookup=lambda key: ai_cache.get(key, count=False),
+        lease=float(os.getenv('SINGLE_FLIGHT_LEASE', '120'))
+    ) if os.getenv('AI_CACHE_DB') else None
+)
+
+# Per-user limits on AI-backed routes, e.g. "20/minute"; RATE_LIMIT_DB shares the buckets between worker processes
+CHAT_RATE_LIMIT = parse_rate(os.getenv('CHAT_RATE_LIMIT', '20/minute'))
+MEDICATION_RATE_LIMIT = parse_rate(os.getenv('MEDICATION_RATE_LIMIT', '5/minute'))
+rate_limit_store = SQLiteBucketStore(os.getenv('RATE_LIMIT_DB')) if os.getenv('RATE_LIMIT_DB') else MemoryBucketStore()
+rate_limiter = RateLimiter(rate_limit_store, identity=lambda: current_user.get_id())
+
+# Concurrent LLM calls per process; when all are busy, callers queue and free slots go to users in turn
+llm_scheduler = FairScheduler(
+    max_concurrent=int(os.getenv('LLM_MAX_CONCURRENT', os.getenv('LLM_POOL_SIZE', '20'))),
+    max_waiting=int(os.getenv('LLM_MAX_WAITING', '1000')),
+    timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '30'))
+)
+LLM_BUSY_MESSAGE = "The AI service is busy right now. Please try again in a moment."
+
+# Password hashing: any Werkzeug method with its cost, e.g. pbkdf2:sha256:600000 or scrypt:32768:8:1.
+# Hashing runs in PASSWORD_HASH_WORKERS processes (0 = on the request thread); hashes made with
+# another method are replaced on the user's next login.
+password_hasher = PasswordHasher(
+    method=os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', '0')),
+    timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT', '30'))
+)
+PASSWORD_BUSY_MESSAGE = "Too many people are signing in right now. Please try again in a moment."
+
+# Background report generation
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '4'))
+REPORT_JOB_STALE_SECONDS = int(os.getenv('REPORT_JOB_STALE_SECONDS', '300'))
+# Failed reports are retried after REPORT_RETRY_DELAY seconds, doubling each time, up to REPORT_MAX_ATTEMPTS runs
+REPORT_MAX_ATTEMPTS = int(os.getenv('REPORT_MAX_ATTEMPTS', '3'))
+REPORT_RETRY_DELAY = float(os.getenv('REPORT_RETRY_DELAY', '30'))
+
+# llm: full AI report per assessment; fast: instant report from precomputed sections, no AI call;
+# hybrid: instant report first, then an AI-written personal summary is added in the background
+REPORT_MODE = os.getenv('REPORT_MODE', 'llm')
+
+# Medication analysis: lists up to this many drugs are analyzed pair by pair
+MEDICATION_MAX_PAIRWISE = int(os.getenv('MEDICATION_MAX_PAIRWISE', '8'))
+medication_pool = ThreadPoolExecutor(max_workers=int(os.getenv('MEDICATION_WORKERS', '8')), thread_name_prefix='medication')
 
 # Database Models
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
     date_of_birth = db.Column(db.Date)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    chat_cleared_at = db.Column(db.DateTime)  # tells every process's chat context cache to drop this user
     
     # Relationships
     heart_assessments = db.relationship('HeartAssessment', backref='patient', lazy=True)
@@ -47,28 +141,47 @@ class User(UserMixin, db.Model):
     chat_sessions = db.relationship('ChatSession', backref='patient', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password, upgrading the stored hash if it was made with an older method"""
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            try:
+                self.set_password(password)
+                db.session.commit()
+            except HashingUnavailable:
+                pass  # the old hash still works; upgrade on a later login
+        return True
 
 class HeartAssessment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     risk_level = db.Column(db.String(20), nullable=False)
-    answers = db.Column(db.Text, nullable=False)  # JSON string
+    answer_mask = db.Column(db.Integer, nullable=False)  # bit i set when factor i is "yes"
+    schema_version = db.Column(db.SmallInteger, nullable=False)  # questionnaire version the mask was written with
     ai_report = db.Column(db.Text)
+    report_job_id = db.Column(db.Integer, index=True)  # shared by a batch's assessments with the same answers
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Per-user history is always read newest first
+    __table_args__ = (db.Index('ix_heart_assessment_user_id_created_at', 'user_id', 'created_at'),)
 
 class StrokeAssessment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)
     risk_level = db.Column(db.String(20), nullable=False)
-    answers = db.Column(db.Text, nullable=False)  # JSON string
+    answer_mask = db.Column(db.Integer, nullable=False)  # bit i set when factor i is "yes"
+    schema_version = db.Column(db.SmallInteger, nullable=False)  # questionnaire version the mask was written with
     ai_report = db.Column(db.Text)
+    report_job_id = db.Column(db.Integer, index=True)  # shared by a batch's assessments with the same answers
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Per-user history is always read newest first
+    __table_args__ = (db.Index('ix_stroke_assessment_user_id_created_at', 'user_id', 'created_at'),)
 
 class MedicationAnalysis(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -76,6 +189,9 @@ class MedicationAnalysis(db.Model):
     medications = db.Column(db.Text, nullable=False)
     ai_analysis = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Per-user history is always read newest first
+    __table_args__ = (db.Index('ix_medication_analysis_user_id_created_at', 'user_id', 'created_at'),)
 
 class ChatSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -83,94 +199,506 @@ class ChatSession(db.Model):
     message = db.Column(db.Text, nullable=False)
     response = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Per-user history is always read newest first
+    __table_args__ = (db.Index('ix_chat_session_user_id_created_at', 'user_id', 'created_at'),)
+
+class ReportJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'heart' or 'stroke'
+    assessment_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    retry_at = db.Column(db.DateTime)  # set while a failed job waits to be retried
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class ReportSection(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    questionnaire = db.Column(db.String(20), nullable=False)  # 'heart' or 'stroke'
+    section = db.Column(db.String(20), nullable=False)  # 'level' or 'factor'
+    key = db.Column(db.String(50), nullable=False)  # risk level or factor key
+    content = db.Column(db.Text, nullable=False)
+    model = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('questionnaire', 'section', 'key', name='uq_report_section'),)
+
+# Population analytics: daily aggregates kept up to date as assessments are inserted
+class AssessmentDailyStat(db.Model):
+    kind = db.Column(db.String(20), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    risk_level = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+
+class FactorDailyStat(db.Model):
+    kind = db.Column(db.String(20), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    risk_level = db.Column(db.String(20), primary_key=True)
+    factor = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+ASSESSMENT_KINDS = {'heart': (HeartAssessment, HEART), 'stroke': (StrokeAssessment, STROKE)}
+assessment_stats = AssessmentAggregates(AssessmentDailyStat.__table__, FactorDailyStat.__table__)
+
+@db.event.listens_for(HeartAssessment, 'after_insert')
+@db.event.listens_for(StrokeAssessment, 'after_insert')
+def record_assessment_stats(mapper, connection, target):
+    # Same connection and transaction as the INSERT, so the aggregates never drift on rollback
+    questionnaire = HEART if isinstance(target, HeartAssessment) else STROKE
+    assessment_stats.record(connection, questionnaire, [
+        (target.created_at, target.risk_level, target.score, target.answer_mask, target.schema_version)
+    ])
+
+def rebuild_analytics(kind='all'):
+    """Recompute the aggregate tables from the assessment tables; returns rows read per kind"""
+    counts = {}
+    for name, (model, questionnaire) in ASSESSMENT_KINDS.items():
+        if kind in (name, 'all'):
+            counts[name] = assessment_stats.rebuild(db.session.connection(), questionnaire, model.__table__)
+            db.session.commit()
+    return counts
+
+# Logged-in users are served from a per-process cache instead of a query per request
+user_cache = UserCache(ttl=int(os.getenv('USER_CACHE_TTL', '300')))
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    user = db.session.get(User, user_id)
+    return user_cache.put(user) if user else None
+
+# Instrumentation: latency histograms, SQL timing and cache counters served at /metrics.
+# METRICS_DIR lets every worker process contribute to each scrape (gunicorn.conf.py sets it).
+metrics = Metrics(Registry(
+    directory=os.getenv('METRICS_DIR') or None,
+    flush_interval=float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+))
+with app.app_context():
+    metrics.init_app(app, db.engine, server_timing=os.getenv('SERVER_TIMING') == '1')
+llm_client.observers.append(metrics.observe_llm)
+
+@metrics.registry.collector
+def collect_cache_stats():
+    ai = ai_cache.stats()
+    users = user_cache.stats()
+    return [
+        ('ai_cache_requests_total', 'counter', 'AI response cache lookups by result', [
+            ({'result': 'memory_hit'}, ai['memory_hits']),
+            ({'result': 'disk_hit'}, ai['disk_hits']),
+            ({'result': 'miss'}, ai['misses']),
+        ]),
+        ('ai_cache_entries', 'gauge', 'Entries in the in-memory AI response cache', [({}, ai['memory_entries'])]),
+        ('llm_coalesced_requests_total', 'counter', 'Cacheable LLM calls by single-flight role', [
+            ({'role': role}, value) for role, value in sorted(llm_flight.stats().items()) if role != 'in_flight'
+        ]),
+        ('user_cache_requests_total', 'counter', 'User identity cache lookups by result', [
+            ({'result': 'hit'}, users['hits']),
+            ({'result': 'miss'}, users['misses']),
+        ]),
+        ('user_cache_entries', 'gauge', 'Entries in the user identity cache', [({}, users['entries'])]),
+    ]
+
+@metrics.registry.collector
+def collect_llm_client_stats():
+    stats = llm_client.stats()
+    return [
+        ('llm_client_events_total', 'counter', 'LLM client retries, failures and circuit breaker rejections', [
+            ({'event': name}, stats[name]) for name in ('attempts', 'retries', 'failures', 'rejected')
+        ]),
+        ('llm_circuit_open', 'gauge', '1 while the LLM circuit breaker is open or half-open', [
+            ({}, 0 if stats['circuit_state'] == 'closed' else 1)
+        ]),
+        ('llm_pool_free_connections', 'gauge', 'Idle slots in the LLM HTTP connection pool', [
+            ({'host': pool['host']}, pool['free_slots']) for pool in stats['pools']
+        ]),
+    ]
+
+@metrics.registry.collector
+def collect_rate_limit_stats():
+    scheduler = llm_scheduler.stats()
+    return [
+        ('rate_limit_rejected_total', 'counter', 'Requests rejected by per-user rate limits', [
+            ({'limit': name}, count) for name, count in sorted(rate_limiter.rejected.items())
+        ]),
+        ('llm_scheduler_active', 'gauge', 'LLM calls holding a concurrency slot', [({}, scheduler['active'])]),
+        ('llm_scheduler_waiting', 'gauge', 'LLM calls queued for a slot', [({}, scheduler['waiting'])]),
+        ('llm_scheduler_rejected_total', 'counter', 'LLM calls that gave up waiting for a slot', [({}, scheduler['rejected'])]),
+    ]
 
-def get_ai_response(prompt, system_message="You are a helpful medical AI assistant."):
-    """Get response from DeepSeek via OpenRouter"""
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require a bearer token"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return metrics.response()
+
+def llm_owner():
+    """Who an LLM call is queued for: the logged-in user, or background work"""
+    if has_request_context() and current_user.is_authenticated:
+        return current_user.id
+    return 'background'
+
+def get_ai_response(prompt, system_message="You are a helpful medical AI assistant.", cache=False, history=None, owner=None):
+    """Get response from DeepSeek via OpenRouter
+
+    With cache=True, successful responses are stored in ai_cache and reused for
+    identical prompts. Only use it for prompts that don't carry per-user context.
+    history is a list of earlier chat messages sent before the prompt. Calls
+    wait for an llm_scheduler slot on behalf of owner (default: the current user).
+    """
     if not OPENROUTER_API_KEY:
         return "Please set your OPENROUTER_API_KEY environment variable to use AI features."
     
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    cache_key = make_cache_key(OPENROUTER_MODEL, system_message, prompt) if cache and not history else None
+    if cache_key:
+        cached = ai_cache.get(cache_key)
+        if cached is not None:
+            return cached
     
-    data = {
-        "model": "deepseek/deepseek-r1:free",
-        "messages": [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.7,
-        "max_tokens": 1000
-    }
+    owner = owner or llm_owner()
+    
+    def fetch():
+        with llm_scheduler.slot(owner):
+            ai_response = llm_client.complete(prompt, system_message, history)
+        if cache_key:
+            ai_cache.set(cache_key, ai_response)
+        return ai_response
     
     try:
-        response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=data)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
+        # Concurrent requests for the same cacheable prompt wait for one call instead of each making their own
+        return llm_flight.do(cache_key, fetch) if cache_key else fetch()
+    except CapacityError:
+        return LLM_BUSY_MESSAGE
     except Exception as e:
         return f"Error getting AI response: {str(e)}"
 
+def is_ai_error(text):
+    """True for the messages get_ai_response returns in place of a response when the call fails"""
+    return text == LLM_BUSY_MESSAGE or text.startswith(("Error getting AI response", "Please set your OPENROUTER_API_KEY"))
+
+def stream_ai_response(prompt, system_message="You are a helpful medical AI assistant.", history=None):
+    """Yield response tokens from DeepSeek via OpenRouter as they are generated"""
+    if not OPENROUTER_API_KEY:
+        yield "Please set your OPENROUTER_API_KEY environment variable to use AI features."
+        return
+    
+    try:
+        with llm_scheduler.slot(llm_owner()):
+            yield from llm_client.stream_chat(llm_client.build_messages(prompt, system_message, history))
+    except CapacityError:
+        yield LLM_BUSY_MESSAGE
+    except Exception as e:
+        yield f"Error getting AI response: {str(e)}"
+
 def calculate_heart_attack_risk(answers):
     """Calculate heart attack risk based on answers"""
-    factors = {
-        "chest_pain": 20,
-        "shortness_breath": 15,
-        "fatigue": 10,
-        "palpitations": 10,
-        "dizziness": 10,
-        "swelling": 10,
-        "nausea": 5,
-        "high_bp": 10,
-        "high_cholesterol": 10,
-        "diabetes": 10,
-        "smoking": 10,
-        "alcohol": 5,
-        "obesity": 10,
-        "sedentary": 5,
-        "family_history": 5,
-        "age": 5,
-        "stress": 5
-    }
-    
-    score = 0
-    for key, weight in factors.items():
-        if answers.get(key) == 'yes':
-            score += weight
-    
-    return min(score, 100)
+    return HEART.score(answers)
 
 def calculate_stroke_risk(answers):
     """Calculate stroke risk based on answers"""
-    factors = {
-        "weakness_numbness": 25,
-        "speech_difficulty": 20,
-        "vision_problems": 10,
-        "balance_issues": 10,
-        "severe_headache": 10,
-        "high_bp": 15,
-        "diabetes": 10,
-        "high_cholesterol": 10,
-        "irregular_heartbeat": 10,
-        "smoking": 10,
-        "alcohol": 5,
-        "obesity": 10,
-        "sedentary": 5,
-        "family_history": 5,
-        "age": 5,
-        "stress": 5
-    }
+    return STROKE.score(answers)
+
+HEART_SYSTEM_MESSAGE = "You are a medical AI assistant specializing in cardiovascular health. Provide helpful, accurate medical information but always remind users to consult healthcare professionals for medical decisions."
+STROKE_SYSTEM_MESSAGE = "You are a medical AI assistant specializing in stroke prevention and neurological health. Provide helpful, accurate medical information but always remind users to consult healthcare professionals for medical decisions."
+REPORT_SYSTEM_MESSAGES = {'heart': HEART_SYSTEM_MESSAGE, 'stroke': STROKE_SYSTEM_MESSAGE}
+REPORT_TOPICS = {'heart': 'heart attack', 'stroke': 'stroke'}
+
+def build_heart_report_prompt(score, risk_level, answers):
+    """Build the AI prompt and system message for a heart attack report"""
+    answers = HEART.normalize(answers)
+    ai_prompt = f"""
+    A patient has completed a heart attack risk assessment with a score of {score}/100 ({risk_level} risk).
+
+    Their responses indicate:
+    {json.dumps(answers, indent=2)}
+
+    Please provide:
+    1. A detailed analysis of their risk factors
+    2. Specific recommendations for lifestyle changes
+    3. When they should see a doctor
+    4. Emergency signs to watch for
+
+    Keep the response professional but accessible to a general audience.
+    """
+
+    return ai_prompt, HEART_SYSTEM_MESSAGE
+
+def build_stroke_report_prompt(score, risk_level, answers):
+    """Build the AI prompt and system message for a stroke report"""
+    answers = STROKE.normalize(answers)
+    ai_prompt = f"""
+    A patient has completed a stroke risk assessment with a score of {score}/100 ({risk_level} risk).
+
+    Their responses indicate:
+    {json.dumps(answers, indent=2)}
+
+    Please provide:
+    1. A detailed analysis of their stroke risk factors
+    2. Specific recommendations for prevention
+    3. When they should seek medical attention
+    4. Warning signs of stroke (BE-FAST protocol)
+
+    Keep the response professional but accessible to a general audience.
+    """
+
+    return ai_prompt, STROKE_SYSTEM_MESSAGE
+
+def build_level_section_prompt(kind, risk_level):
+    """Prompt for the precomputed section shared by every report at one risk level"""
+    topic = REPORT_TOPICS[kind]
+    warning_signs = "Warning signs of stroke (BE-FAST protocol)" if kind == 'stroke' else "Emergency signs of a heart attack to watch for"
+    ai_prompt = f"""
+    Write one section of a {topic} risk report for patients whose assessment puts them at {risk_level} risk.
+
+    Cover, in plain text without markdown headings:
+    1. What a {risk_level.lower()} {topic} risk result means
+    2. When they should see a doctor, and how urgently
+    3. {warning_signs}
+
+    Address the reader as "you". Keep it under 250 words, professional but accessible to a general audience.
+    """
+    return ai_prompt, REPORT_SYSTEM_MESSAGES[kind]
+
+def build_factor_section_prompt(kind, factor):
+    """Prompt for the precomputed section shown when a patient answers yes to one factor"""
+    questionnaire = QUESTIONNAIRES[kind]
+    question = questionnaire.questions[questionnaire.keys.index(factor)]
+    ai_prompt = f"""
+    Write one section of a {REPORT_TOPICS[kind]} risk report for a patient who answered "yes" to: "{question}"
+
+    Cover, in plain text without markdown headings:
+    1. Why this factor raises their {REPORT_TOPICS[kind]} risk
+    2. Two to four specific, practical recommendations
+
+    Address the reader as "you". Keep it under 150 words, professional but accessible to a general audience.
+    """
+    return ai_prompt, REPORT_SYSTEM_MESSAGES[kind]
+
+def build_personalization_prompt(kind, score, risk_level, answers):
+    """Prompt for the short personal summary placed above a precomputed report"""
+    questionnaire = QUESTIONNAIRES[kind]
+    factors = [question for key, question in zip(questionnaire.keys, questionnaire.questions) if answers.get(key) == 'yes']
+    ai_prompt = f"""
+    A patient has completed a {REPORT_TOPICS[kind]} risk assessment with a score of {score}/100 ({risk_level} risk).
+
+    They answered yes to:
+    {json.dumps(factors, indent=2)}
+
+    Their report already explains each factor and the warning signs separately. Write a short personal
+    summary (at most 120 words) that ties their factors together and names the two or three changes
+    likely to make the biggest difference for them. Plain text, addressed to the patient as "you".
+    """
+    return ai_prompt, REPORT_SYSTEM_MESSAGES[kind]
+
+MEDICATION_SYSTEM_MESSAGE = "You are a clinical pharmacist AI assistant. Provide detailed medication interaction analysis while emphasizing the importance of consulting healthcare professionals for medication management."
+
+def build_medication_list_prompt(medications):
+    """Prompt for a full analysis of a medication list (normalized names joined by commas, or the raw text)"""
+    return f"""
+    Please analyze the following list of medications for potential interactions, side effects, and safety concerns:
+    
+    Medications: {medications}
+    
+    Please provide:
+    1. Potential drug interactions between these medications
+    2. Common side effects for each medication
+    3. Any serious warnings or contraindications
+    4. Recommendations for monitoring or precautions
+    5. Suggestions for timing of doses if relevant
     
-    score = 0
-    for key, weight in factors.items():
-        if answers.get(key) == 'yes':
-            score += weight
+    Important: This is for educational purposes only and should not replace professional medical advice.
+    """
+
+def build_medication_profile_prompt(name):
+    """Prompt for the stand-alone profile of one medication"""
+    return f"""
+    Please summarize the safety profile of this medication: {name}
+    
+    Please provide:
+    1. Common side effects
+    2. Any serious warnings or contraindications
+    3. Recommendations for monitoring or precautions
+    4. Suggestions for timing of doses if relevant
     
-    return min(score, 100)
+    Do not discuss interactions with other medications. Keep it concise.
+    Important: This is for educational purposes only and should not replace professional medical advice.
+    """
+
+def build_medication_pair_prompt(drug_a, drug_b):
+    """Prompt for the interaction between two medications"""
+    return f"""
+    Please analyze the potential interaction between these two medications: {drug_a} and {drug_b}
+    
+    Please provide:
+    1. Whether a clinically relevant interaction is known, and its severity
+    2. The mechanism and what the patient may notice
+    3. Recommended monitoring, spacing of doses or alternatives
+    
+    If no significant interaction is known, say so briefly.
+    Important: This is for educational purposes only and should not replace professional medical advice.
+    """
+
+def analyze_medication_list(names, text=None):
+    """Build a medication analysis from cached per-drug and per-pair sections
+
+    Every drug profile and every drug pair is a separate deterministic prompt,
+    so sections already seen for any earlier list come from ai_cache and only
+    new drugs and new combinations are sent to the model. With text (the list
+    as entered), the whole text is analyzed in one prompt instead; use it when
+    the normalizer left words it couldn't place, so no drug is dropped.
+    """
+    if text is not None:
+        return get_ai_response(build_medication_list_prompt(text), MEDICATION_SYSTEM_MESSAGE, cache=True)
+    if len(names) == 1 or len(names) > MEDICATION_MAX_PAIRWISE:
+        return get_ai_response(build_medication_list_prompt(', '.join(names)), MEDICATION_SYSTEM_MESSAGE, cache=True)
+    
+    # Pool threads have no request context, so queue their LLM calls for this user explicitly
+    owner = llm_owner()
+    pairs = medication_pairs(names)
+    profile_futures = [
+        medication_pool.submit(get_ai_response, build_medication_profile_prompt(name), MEDICATION_SYSTEM_MESSAGE, cache=True, owner=owner)
+        for name in names
+    ]
+    pair_futures = [
+        medication_pool.submit(get_ai_response, build_medication_pair_prompt(a, b), MEDICATION_SYSTEM_MESSAGE, cache=True, owner=owner)
+        for a, b in pairs
+    ]
+    
+    sections = ["DRUG INTERACTIONS"]
+    for (a, b), future in zip(pairs, pair_futures):
+        sections.append(f"\n{a.title()} + {b.title()}\n{future.result().strip()}")
+    
+    sections.append("\nINDIVIDUAL MEDICATIONS")
+    for name, future in zip(names, profile_futures):
+        sections.append(f"\n{name.title()}\n{future.result().strip()}")
+    
+    sections.append("\nImportant: This is for educational purposes only and should not replace professional medical advice.")
+    return "\n".join(sections)
+
+# Report job kinds: assessment model and prompt builder
+REPORT_KINDS = {
+    'heart': (HeartAssessment, build_heart_report_prompt),
+    'stroke': (StrokeAssessment, build_stroke_report_prompt),
+}
+
+def run_report_job(job_id):
+    """Generate the AI report for a queued assessment (runs on a worker thread)"""
+    # Claim the job atomically so a job is never processed twice; failed jobs only once their retry is due
+    now = datetime.utcnow()
+    claimed = ReportJob.query.filter(
+        ReportJob.id == job_id,
+        db.or_(ReportJob.status == 'pending', db.and_(ReportJob.status == 'failed', ReportJob.retry_at <= now))
+    ).update({
+        'status': 'running',
+        'started_at': now,
+        'retry_at': None,
+        'attempts': ReportJob.attempts + 1
+    }, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return
+
+    job = db.session.get(ReportJob, job_id)
+    model, build_prompt = REPORT_KINDS[job.kind]
+    assessment = db.session.get(model, job.assessment_id)
+
+    try:
+        if assessment is None:
+            raise LookupError(f'{job.kind} assessment {job.assessment_id} no longer exists')
+        answers = QUESTIONNAIRES[job.kind].decode_mask(assessment.answer_mask, assessment.schema_version)
+        instant = report_library.assemble(job.kind, assessment.score, assessment.risk_level, answers)
+        if REPORT_MODE == 'hybrid' and instant is not None:
+            summary = get_ai_response(*build_personalization_prompt(job.kind, assessment.score, assessment.risk_level, answers), cache=True)
+            assessment.ai_report = instant if is_ai_error(summary) else f"{summary.strip()}\n\n{instant}"
+        else:
+            ai_prompt, system_message = build_prompt(assessment.score, assessment.risk_level, answers)
+            ai_report = get_ai_response(ai_prompt, system_message, cache=True)
+            if is_ai_error(ai_report):
+                if instant is None:
+                    raise RuntimeError(ai_report)
+                # Fall back to the precomputed report when the AI call fails
+                ai_report = instant
+            assessment.ai_report = ai_report
+        # Batch submissions queue one job per answer profile; every assessment with it gets the report
+        model.query.filter(model.report_job_id == job.id, model.id != assessment.id).update(
+            {'ai_report': assessment.ai_report}, synchronize_session=False
+        )
+        job.status = 'done'
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(ReportJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        if job.attempts < REPORT_MAX_ATTEMPTS and not isinstance(e, LookupError):
+            delay = REPORT_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.retry_at = datetime.utcnow() + timedelta(seconds=delay)
+
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    if job.retry_at is not None:
+        report_pool.submit_later(job_id, (job.retry_at - datetime.utcnow()).total_seconds())
+
+report_pool = ReportWorkerPool(app, run_report_job, max_workers=REPORT_WORKERS)
+
+report_library = ReportLibrary(
+    QUESTIONNAIRES,
+    loader=lambda: db.session.execute(
+        db.select(ReportSection.questionnaire, ReportSection.section, ReportSection.key, ReportSection.content)
+    ).all(),
+    ttl=int(os.getenv('REPORT_SECTIONS_TTL', '300'))
+)
+
+def start_report(kind, assessment, answers):
+    """Fill in the instant report for REPORT_MODE and queue an AI job if one is still needed
+
+    Returns the queued job, or None when the report is already complete.
+    Call report_pool.submit(job.id) after committing.
+    """
+    if REPORT_MODE in ('fast', 'hybrid'):
+        assessment.ai_report = report_library.assemble(kind, assessment.score, assessment.risk_level, answers)
+        if REPORT_MODE == 'fast' and assessment.ai_report is not None:
+            return None
+    job = enqueue_report(kind, assessment.id)
+    db.session.flush()
+    assessment.report_job_id = job.id
+    return job
+
+def enqueue_report(kind, assessment_id):
+    """Persist a report job for an assessment; call submit_report_job after committing"""
+    job = ReportJob(kind=kind, assessment_id=assessment_id)
+    db.session.add(job)
+    return job
+
+def resume_report_jobs():
+    """Re-queue jobs left pending or stuck running by a previous process"""
+    stale_before = datetime.utcnow() - timedelta(seconds=REPORT_JOB_STALE_SECONDS)
+    ReportJob.query.filter(
+        ReportJob.status == 'running',
+        ReportJob.started_at < stale_before
+    ).update({'status': 'pending'})
+    db.session.commit()
+
+    for (job_id,) in db.session.query(ReportJob.id).filter_by(status='pending').all():
+        report_pool.submit(job_id)
+    now = datetime.utcnow()
+    for job_id, retry_at in db.session.query(ReportJob.id, ReportJob.retry_at).filter(
+        ReportJob.status == 'failed', ReportJob.retry_at.isnot(None)
+    ).all():
+        report_pool.submit_later(job_id, (retry_at - now).total_seconds())
 
 # Authentication routes
 @app.route('/register', methods=['GET', 'POST'])
@@ -201,7 +729,11 @@ def register():
             last_name=last_name,
             date_of_birth=datetime.strptime(date_of_birth, '%Y-%m-%d').date() if date_of_birth else None
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingUnavailable:
+            flash(PASSWORD_BUSY_MESSAGE, 'danger')
+            return render_template('register.html'), 503
         
         db.session.add(user)
         db.session.commit()
@@ -220,7 +752,13 @@ def login():
         
         user = User.query.filter_by(username=username).first()
         
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except HashingUnavailable:
+            flash(PASSWORD_BUSY_MESSAGE, 'danger')
+            return render_template('login.html'), 503
+        
+        if valid:
             login_user(user)
             next_page = request.args.get('next')
             flash(f'Welcome back, {user.first_name}!', 'success')
@@ -252,6 +790,172 @@ def dashboard():
                          recent_stroke=recent_stroke, 
                          recent_medications=recent_medications)
 
+# History feed: (kind, model, summary column or None); score and risk level come from HISTORY_COLUMNS
+HISTORY_SOURCES = [
+    ('chat', ChatSession, ChatSession.message),
+    ('heart', HeartAssessment, None),
+    ('medication', MedicationAnalysis, MedicationAnalysis.medications),
+    ('stroke', StrokeAssessment, None),
+]
+# Assessment columns included in the feed (NULL for the other kinds)
+HISTORY_COLUMNS = ('score', 'risk_level', 'answer_mask', 'schema_version')
+HISTORY_SUMMARY_LENGTH = 200
+
+def encode_history_cursor(created_at, kind, item_id):
+    raw = f"{created_at.isoformat()}|{kind}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_history_cursor(cursor):
+    created_at, kind, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), kind, int(item_id)
+
+def history_query(user_id, limit, cursor=None):
+    """Build one UNION ALL query for a user's merged, newest-first history
+
+    Items are ordered by (created_at, kind, id) descending and paginated by
+    keyset: the cursor is the last item of the previous page. The cursor
+    condition and a LIMIT are pushed into every branch, so each branch is a
+    short range scan on its (user_id, created_at) index and the cost of a
+    page does not grow with the length of the history.
+    """
+    branches = []
+    for kind, model, summary in HISTORY_SOURCES:
+        query = db.select(
+            db.literal(kind).label('kind'),
+            model.id.label('id'),
+            model.created_at.label('created_at'),
+            *[getattr(model, name, db.null()).label(name) for name in HISTORY_COLUMNS],
+            (db.func.substr(summary, 1, HISTORY_SUMMARY_LENGTH) if summary is not None else db.null()).label('summary')
+        ).where(model.user_id == user_id)
+        
+        if cursor:
+            before_at, before_kind, before_id = cursor
+            if kind > before_kind:
+                query = query.where(model.created_at < before_at)
+            elif kind == before_kind:
+                query = query.where(db.or_(
+                    model.created_at < before_at,
+                    db.and_(model.created_at == before_at, model.id < before_id)
+                ))
+            else:
+                query = query.where(model.created_at <= before_at)
+        
+        query = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit)
+        branches.append(db.select(query.subquery()))
+    
+    feed = db.union_all(*branches).subquery()
+    return db.select(feed).order_by(feed.c.created_at.desc(), feed.c.kind.desc(), feed.c.id.desc()).limit(limit)
+
+@app.route('/api/analytics')
+def analytics():
+    """Population statistics for one questionnaire, served from the daily aggregates
+
+    Small daily cells can reveal one patient's answers, so this is for clinic
+    staff only: it requires the ANALYTICS_TOKEN bearer token and is off when
+    that isn't set.
+    """
+    token = os.getenv('ANALYTICS_TOKEN')
+    if not token:
+        return jsonify({'error': 'Analytics are disabled'}), 404
+    if request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    kind = request.args.get('kind', 'heart')
+    if kind not in ASSESSMENT_KINDS:
+        return jsonify({'error': 'Unknown assessment type'}), 404
+    
+    days = request.args.get('days', type=int)
+    since = (datetime.utcnow() - timedelta(days=max(1, days) - 1)).date() if days else None
+    _, questionnaire = ASSESSMENT_KINDS[kind]
+    return jsonify(assessment_stats.summary(db.session.connection(), questionnaire, since))
+
+def decode_export_answers(record):
+    questionnaire = QUESTIONNAIRES[record['type']]
+    record['factors'] = questionnaire.mask_keys(record.pop('answer_mask'), record.pop('schema_version'))
+    return record
+
+EXPORT_SOURCES = [
+    ExportSource(kind, model.__table__, {
+        'created_at': model.created_at, 'score': model.score, 'risk_level': model.risk_level,
+        'answer_mask': model.answer_mask, 'schema_version': model.schema_version, 'report': model.ai_report
+    }, transform=decode_export_answers)
+    for kind, (model, _) in ASSESSMENT_KINDS.items()
+] + [
+    ExportSource('medication', MedicationAnalysis.__table__, {
+        'created_at': MedicationAnalysis.created_at, 'medications': MedicationAnalysis.medications,
+        'report': MedicationAnalysis.ai_analysis
+    }),
+    ExportSource('chat', ChatSession.__table__, {
+        'created_at': ChatSession.created_at, 'message': ChatSession.message, 'response': ChatSession.response
+    }),
+]
+EXPORT_FIELDS = ['type', 'id', 'created_at', 'username', 'email', 'first_name', 'last_name', 'date_of_birth',
+                 'score', 'risk_level', 'factors', 'medications', 'message', 'response', 'report']
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+
+def export_disposition(filename):
+    """Content-Disposition for a download: an ASCII filename plus the exact one in RFC 5987 form"""
+    fallback = re.sub(r'[^A-Za-z0-9._-]', '_', filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+def export_user_records(user, fmt, compress=False):
+    """Byte chunks of a user's complete record: profile, assessments, medication analyses and chats"""
+    profile = {'type': 'profile', 'id': user.id, 'created_at': user.created_at, 'username': user.username,
+               'email': user.email, 'first_name': user.first_name, 'last_name': user.last_name,
+               'date_of_birth': user.date_of_birth}
+    
+    def records():
+        yield profile
+        yield from iter_records(db.session, EXPORT_SOURCES, user.id, page_size=EXPORT_PAGE_SIZE)
+    
+    texts = csv_chunks(records(), EXPORT_FIELDS) if fmt == 'csv' else ndjson_chunks(records())
+    return encode_chunks(texts, compress=compress)
+
+@app.route('/api/export')
+@login_required
+def export_records():
+    """Download everything stored for the current user as a streamed CSV or NDJSON file"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'Format must be ndjson or csv'}), 400
+    compress = request.args.get('gzip') == '1'
+    
+    filename = f"cardiovision-{current_user.username}-{datetime.utcnow():%Y%m%d}.{fmt}" + ('.gz' if compress else '')
+    return Response(stream_with_context(export_user_records(current_user, fmt, compress)),
+                    mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': export_disposition(filename),
+                             'X-Accel-Buffering': 'no'})
+
+@app.route('/api/history')
+@login_required
+def history():
+    """Paginated, time-ordered feed of assessments, analyses and chats"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    cursor = request.args.get('cursor')
+    
+    try:
+        cursor = decode_history_cursor(cursor) if cursor else None
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    rows = db.session.execute(history_query(current_user.id, limit, cursor)).all()
+    items = [{
+        'type': row.kind,
+        'id': row.id,
+        'created_at': row.created_at.isoformat(),
+        'score': row.score,
+        'risk_level': row.risk_level,
+        'factors': QUESTIONNAIRES[row.kind].mask_keys(row.answer_mask, row.schema_version) if row.kind in QUESTIONNAIRES else None,
+        'summary': row.summary
+    } for row in rows]
+    
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_history_cursor(last.created_at, last.kind, last.id)
+    
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
 @app.route('/')
 def landing():
     """Landing page"""
@@ -271,46 +975,30 @@ def heart_attack_assessment():
     """Process heart attack risk assessment"""
     answers = request.form.to_dict()
     score = calculate_heart_attack_risk(answers)
+    risk_level = risk_level_for(score)
     
-    # Generate AI report
-    risk_level = "Low" if score < 30 else "Moderate" if score < 60 else "High"
-    
-    ai_prompt = f"""
-    A patient has completed a heart attack risk assessment with a score of {score}/100 ({risk_level} risk).
-    
-    Their responses indicate:
-    {json.dumps(answers, indent=2)}
-    
-    Please provide:
-    1. A detailed analysis of their risk factors
-    2. Specific recommendations for lifestyle changes
-    3. When they should see a doctor
-    4. Emergency signs to watch for
-    
-    Keep the response professional but accessible to a general audience.
-    """
-    
-    system_message = "You are a medical AI assistant specializing in cardiovascular health. Provide helpful, accurate medical information but always remind users to consult healthcare professionals for medical decisions."
-    
-    ai_report = get_ai_response(ai_prompt, system_message)
-    
-    # Save assessment to database
+    # Save assessment to database; the AI report is generated in the background
     assessment = HeartAssessment(
         user_id=current_user.id,
         score=score,
         risk_level=risk_level,
-        answers=json.dumps(answers),
-        ai_report=ai_report
+        answer_mask=HEART.encode_mask(answers),
+        schema_version=HEART.version
     )
     db.session.add(assessment)
+    db.session.flush()
+    job = start_report('heart', assessment, answers)
     db.session.commit()
+    if job is not None:
+        report_pool.submit(job.id)
     
     return render_template('heart_attack_result.html', 
                          score=score, 
                          risk_level=risk_level, 
-                         ai_report=ai_report,
+                         ai_report=assessment.ai_report,
                          answers=answers,
-                         assessment_id=assessment.id)
+                         assessment_id=assessment.id,
+                         report_url=url_for('report_status', kind='heart', assessment_id=assessment.id) if job else None)
 
 @app.route('/stroke')
 @login_required
@@ -324,46 +1012,186 @@ def stroke_assessment():
     """Process stroke risk assessment"""
     answers = request.form.to_dict()
     score = calculate_stroke_risk(answers)
+    risk_level = risk_level_for(score)
     
-    # Generate AI report
-    risk_level = "Low" if score < 30 else "Moderate" if score < 60 else "High"
-    
-    ai_prompt = f"""
-    A patient has completed a stroke risk assessment with a score of {score}/100 ({risk_level} risk).
-    
-    Their responses indicate:
-    {json.dumps(answers, indent=2)}
-    
-    Please provide:
-    1. A detailed analysis of their stroke risk factors
-    2. Specific recommendations for prevention
-    3. When they should seek medical attention
-    4. Warning signs of stroke (BE-FAST protocol)
-    
-    Keep the response professional but accessible to a general audience.
-    """
-    
-    system_message = "You are a medical AI assistant specializing in stroke prevention and neurological health. Provide helpful, accurate medical information but always remind users to consult healthcare professionals for medical decisions."
-    
-    ai_report = get_ai_response(ai_prompt, system_message)
-    
-    # Save assessment to database
+    # Save assessment to database; the AI report is generated in the background
     assessment = StrokeAssessment(
         user_id=current_user.id,
         score=score,
         risk_level=risk_level,
-        answers=json.dumps(answers),
-        ai_report=ai_report
+        answer_mask=STROKE.encode_mask(answers),
+        schema_version=STROKE.version
     )
     db.session.add(assessment)
+    db.session.flush()
+    job = start_report('stroke', assessment, answers)
     db.session.commit()
+    if job is not None:
+        report_pool.submit(job.id)
     
     return render_template('stroke_result.html', 
                          score=score, 
                          risk_level=risk_level, 
-                         ai_report=ai_report,
+                         ai_report=assessment.ai_report,
                          answers=answers,
-                         assessment_id=assessment.id)
+                         assessment_id=assessment.id,
+                         report_url=url_for('report_status', kind='stroke', assessment_id=assessment.id) if job else None)
+
+@app.route('/api/reports/<kind>/<int:assessment_id>')
+@login_required
+def report_status(kind, assessment_id):
+    """Poll the status of a background AI report"""
+    if kind not in REPORT_KINDS:
+        return jsonify({'error': 'Unknown report type'}), 404
+    
+    model, _ = REPORT_KINDS[kind]
+    assessment = model.query.filter_by(id=assessment_id, user_id=current_user.id).first()
+    if assessment is None:
+        return jsonify({'error': 'Assessment not found'}), 404
+    
+    if assessment.report_job_id:
+        job = db.session.get(ReportJob, assessment.report_job_id)
+    else:
+        # Assessments from before report_job_id was recorded
+        job = ReportJob.query.filter_by(kind=kind, assessment_id=assessment_id).order_by(ReportJob.id.desc()).first()
+    return jsonify(report_state(assessment, job))
+
+@app.route('/api/reports/<kind>')
+@login_required
+def report_statuses(kind):
+    """Status of many background AI reports at once, e.g. ?ids=1,2,3 for a batch submission"""
+    if kind not in REPORT_KINDS:
+        return jsonify({'error': 'Unknown report type'}), 404
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of assessment ids'}), 400
+    if len(ids) > ASSESSMENT_BATCH_MAX:
+        return jsonify({'error': f'At most {ASSESSMENT_BATCH_MAX} ids per request'}), 400
+    
+    model, _ = REPORT_KINDS[kind]
+    assessments = model.query.filter(model.id.in_(ids), model.user_id == current_user.id).all() if ids else []
+    job_ids = {a.report_job_id for a in assessments if a.report_job_id}
+    jobs = {job.id: job for job in ReportJob.query.filter(ReportJob.id.in_(job_ids))} if job_ids else {}
+    reports = {str(a.id): report_state(a, jobs.get(a.report_job_id)) for a in assessments}
+    missing = [i for i in ids if str(i) not in reports]
+    return jsonify({'reports': reports, 'missing': missing})
+
+def report_state(assessment, job):
+    """Report status payload for an assessment and its latest job, if any"""
+    if job and job.status in ('pending', 'running'):
+        # In hybrid mode ai_report already holds the instant report while the job personalizes it
+        status = job.status
+    elif assessment.ai_report is not None:
+        status = 'done'
+    else:
+        status = job.status if job else 'failed'
+    
+    return {
+        'status': status,
+        'ai_report': assessment.ai_report,
+        'error': job.error if job and status == 'failed' else None,
+        # A failed job that will run again; clients can keep polling until then
+        'retry_at': job.retry_at.isoformat() if job and status == 'failed' and job.retry_at else None
+    }
+
+ASSESSMENT_BATCH_MAX = int(os.getenv('ASSESSMENT_BATCH_MAX', '1000'))
+
+@app.route('/api/assessments/batch', methods=['POST'])
+@login_required
+def assessment_batch():
+    """Score and store many heart or stroke assessments in one request
+
+    Expects {"kind": "heart"|"stroke", "assessments": [{factor: "yes"|"no"|true|false, ...}, ...]}
+    and returns the new ids, scores and risk levels in submission order. An
+    unknown factor or value rejects the whole batch, naming the item's index.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    kind = payload.get('kind')
+    items = payload.get('assessments')
+    if not isinstance(kind, str) or kind not in ASSESSMENT_KINDS:
+        return jsonify({'error': 'kind must be heart or stroke'}), 400
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'assessments must be a non-empty list of answer objects'}), 400
+    if len(items) > ASSESSMENT_BATCH_MAX:
+        return jsonify({'error': f'At most {ASSESSMENT_BATCH_MAX} assessments per request'}), 413
+    
+    model, questionnaire = ASSESSMENT_KINDS[kind]
+    answers = []
+    for index, item in enumerate(items):
+        unknown = sorted(set(item) - set(questionnaire.keys))
+        if unknown:
+            return jsonify({'error': f'Unknown {kind} factors: {", ".join(unknown)}', 'index': index}), 400
+        parsed = {key: parse_answer(value) for key, value in item.items()}
+        invalid = [key for key, value in parsed.items() if value is None]
+        if invalid:
+            return jsonify({'error': f'{invalid[0]} must be yes/no or true/false, got {item[invalid[0]]!r}',
+                            'index': index}), 400
+        answers.append({key: 'yes' if value else 'no' for key, value in parsed.items()})
+    matrix = questionnaire.encode_many(answers)
+    masks = questionnaire.matrix_to_masks(matrix)
+    scores = questionnaire.score_batch(matrix)
+    levels = risk_levels(scores)
+    
+    # One report per distinct answer profile: identical answers give identical reports
+    profiles, first, inverse = np.unique(masks, return_index=True, return_inverse=True)
+    reports = [None] * len(profiles)
+    job_ids = [None] * len(profiles)
+    for p, mask in enumerate(profiles.tolist()):
+        i = first[p]
+        if REPORT_MODE in ('fast', 'hybrid'):
+            reports[p] = report_library.assemble(kind, int(scores[i]), str(levels[i]), questionnaire.decode_mask(mask))
+    needs_job = [p for p in range(len(profiles)) if not (REPORT_MODE == 'fast' and reports[p] is not None)]
+    if needs_job:
+        # Jobs first so every assessment row can be inserted with its report_job_id
+        new_ids = db.session.execute(
+            db.insert(ReportJob).returning(ReportJob.id),
+            [{'kind': kind, 'assessment_id': 0} for _ in needs_job]
+        ).scalars().all()
+        for p, job_id in zip(needs_job, new_ids):
+            job_ids[p] = job_id
+    
+    created_at = datetime.utcnow()
+    rows = [{
+        'user_id': current_user.id,
+        'score': int(scores[i]),
+        'risk_level': str(levels[i]),
+        'answer_mask': int(masks[i]),
+        'schema_version': questionnaire.version,
+        'ai_report': reports[inverse[i]],
+        'report_job_id': job_ids[inverse[i]],
+        'created_at': created_at,
+    } for i in range(len(items))]
+    # Multi-row INSERTs assign ids in VALUES order, but RETURNING may list them in any order; sorting
+    # restores submission order without sort_by_parameter_order, which SQLite runs one row at a time
+    ids = sorted(db.session.execute(db.insert(model).returning(model.id), rows).scalars().all())
+    if needs_job:
+        db.session.execute(db.update(ReportJob), [
+            {'id': job_ids[p], 'assessment_id': ids[first[p]]} for p in needs_job
+        ])
+    # Bulk inserts skip the after_insert listener, so update the aggregates here in the same transaction
+    assessment_stats.record(db.session.connection(), questionnaire, [
+        (created_at, row['risk_level'], row['score'], row['answer_mask'], row['schema_version']) for row in rows
+    ])
+    db.session.commit()
+    for p in needs_job:
+        report_pool.submit(job_ids[p])
+    
+    return jsonify({
+        'kind': kind,
+        'count': len(ids),
+        'profiles': len(profiles),
+        'report_jobs': len(needs_job),
+        'reports_url': url_for('report_statuses', kind=kind),
+        'assessments': [{
+            'id': ids[i],
+            'score': rows[i]['score'],
+            'risk_level': rows[i]['risk_level'],
+            'report_status': 'pending' if rows[i]['report_job_id'] else 'done',
+        } for i in range(len(ids))]
+    }), 201
 
 @app.route('/medication-analysis')
 @login_required
@@ -371,37 +1199,28 @@ def medication_analysis():
     """Medication interaction analysis page"""
     return render_template('medication_analysis.html')
 
+def medication_rate_limited(retry_after):
+    return render_template('medication_analysis.html',
+                           error=f"You've run several analyses in a short time. Please try again in {int(retry_after) + 1} seconds."), 429
+
 @app.route('/medication-analysis', methods=['POST'])
 @login_required
+@rate_limiter.limit('medication', MEDICATION_RATE_LIMIT, on_limit=medication_rate_limited)
 def analyze_medications():
     """Analyze medication interactions"""
     medications = request.form.get('medications', '').strip()
     
-    if not medications:
+    names, unrecognized = parse_medications(medications)
+    if not names and not unrecognized:
         return render_template('medication_analysis.html', error="Please enter at least one medication.")
     
-    ai_prompt = f"""
-    Please analyze the following list of medications for potential interactions, side effects, and safety concerns:
-    
-    Medications: {medications}
-    
-    Please provide:
-    1. Potential drug interactions between these medications
-    2. Common side effects for each medication
-    3. Any serious warnings or contraindications
-    4. Recommendations for monitoring or precautions
-    5. Suggestions for timing of doses if relevant
-    
-    Important: This is for educational purposes only and should not replace professional medical advice.
-    """
-    
-    system_message = "You are a clinical pharmacist AI assistant. Provide detailed medication interaction analysis while emphasizing the importance of consulting healthcare professionals for medication management."
-    
-    ai_analysis = get_ai_response(ai_prompt, system_message)
+    user_id = current_user.id
+    release_db_connection()
+    ai_analysis = analyze_medication_list(names, text=medications if unrecognized else None)
     
     # Save analysis to database
     analysis = MedicationAnalysis(
-        user_id=current_user.id,
+        user_id=user_id,
         medications=medications,
         ai_analysis=ai_analysis
     )
@@ -410,6 +1229,8 @@ def analyze_medications():
     
     return render_template('medication_result.html', 
                          medications=medications, 
+                         names=names,
+                         unrecognized=unrecognized,
                          analysis=ai_analysis,
                          analysis_id=analysis.id)
 
@@ -419,19 +1240,81 @@ def ai_chat():
     """AI chat interface"""
     return render_template('ai_chat.html')
 
-@app.route('/ai-chat', methods=['POST'])
-@login_required
-def chat_with_ai():
-    """Handle AI chat messages"""
-    user_message = request.json.get('message', '').strip()
+# Optional group commit: batch chat inserts from concurrent requests into one transaction
+chat_writer = GroupCommitWriter(
+    app, db, ChatSession,
+    max_batch=int(os.getenv('CHAT_GROUP_COMMIT_BATCH', '100')),
+    max_delay=int(os.getenv('CHAT_GROUP_COMMIT_DELAY_MS', '50')) / 1000
+) if os.getenv('CHAT_GROUP_COMMIT') == '1' else None
+
+def save_chat(user_id, message, response):
+    """Persist one chat exchange"""
+    if chat_writer is not None:
+        chat_writer.submit(user_id=user_id, message=message, response=response)
+        conversations.append(user_id, message, response)
+        return
     
-    if not user_message:
-        return jsonify({'error': 'Please enter a message'})
+    chat = ChatSession(
+        user_id=user_id,
+        message=message,
+        response=response
+    )
+    db.session.add(chat)
+    db.session.commit()
+    conversations.append(user_id, message, response, turn_id=chat.id)
+
+def load_chat_turns(user_id, limit, after_id=0):
+    """Most recent chat turns of a user stored after ``after_id``, oldest first, as (id, message, response)"""
+    rows = db.session.execute(
+        db.select(ChatSession.id, ChatSession.message, ChatSession.response)
+        .where(ChatSession.user_id == user_id, ChatSession.id > after_id)
+        .order_by(ChatSession.id.desc())
+        .limit(limit)
+    ).all()
+    return [tuple(row) for row in reversed(rows)]
+
+def chat_cleared_at(user_id):
+    """When the user last cleared their chat; read fresh, since another worker may have done it"""
+    return db.session.execute(db.select(User.chat_cleared_at).where(User.id == user_id)).scalar()
+
+def summarize_chat(previous_summary, turns):
+    """Fold older chat turns into the rolling conversation summary"""
+    if not OPENROUTER_API_KEY:
+        raise RuntimeError('OPENROUTER_API_KEY is not set')
     
-    # Prepare AI prompt with context
-    system_message = f"""You are CardioVision AI, a helpful medical assistant specializing in cardiovascular health, stroke prevention, and general health guidance. 
+    transcript = "\n".join(f"Patient: {message}\nAssistant: {response}" for message, response in turns)
+    prompt = f"""
+    Summary so far:
+    {previous_summary or '(none)'}
     
-    You are speaking with {current_user.first_name} {current_user.last_name}, a registered patient.
+    New conversation turns:
+    {transcript}
+    
+    Update the summary to cover the new turns. Keep health facts the patient shared (symptoms, conditions, medications, concerns) and advice already given. Use at most 150 words.
+    """
+    
+    # Counted against LLM_MAX_CONCURRENT like every other call; a CapacityError leaves the turns for the next try
+    with llm_scheduler.slot('background'):
+        return llm_client.complete(prompt, "You summarize medical chat conversations accurately and concisely.")
+
+# Multi-turn context: recent turns per user in memory, older turns compacted into a summary
+conversations = ConversationStore(
+    load_chat_turns,
+    summarize_chat,
+    token_budget=int(os.getenv('CHAT_CONTEXT_TOKENS', '2000')),
+    max_turns=int(os.getenv('CHAT_CONTEXT_TURNS', '64')),
+    compact_after=int(os.getenv('CHAT_SUMMARY_AFTER', '6')),
+    executor=ThreadPoolExecutor(max_workers=2, thread_name_prefix='chat-summary'),
+    # Other workers' turns are picked up at most this many seconds apart (0 = on every message)
+    version=chat_cleared_at,
+    sync_interval=float(os.getenv('CHAT_CONTEXT_SYNC', '0'))
+)
+
+def build_chat_system_message(user):
+    """Build the chat system message for a patient"""
+    return f"""You are CardioVision AI, a helpful medical assistant specializing in cardiovascular health, stroke prevention, and general health guidance. 
+    
+    You are speaking with {user.first_name} {user.last_name}, a registered patient.
     
     You can help with:
     - Heart health questions
@@ -441,30 +1324,260 @@ def chat_with_ai():
     - Lifestyle recommendations
     
     Always remind users that your advice is for educational purposes and they should consult healthcare professionals for medical decisions."""
+
+@app.route('/ai-chat', methods=['POST'])
+@login_required
+@rate_limiter.limit('chat', CHAT_RATE_LIMIT)
+def chat_with_ai():
+    """Handle AI chat messages"""
+    user_message = request.json.get('message', '').strip()
+    
+    if not user_message:
+        return jsonify({'error': 'Please enter a message'})
+    
+    # Prepare AI prompt with context
+    system_message = build_chat_system_message(current_user)
+    user_id = current_user.id
+    history = conversations.context(user_id, system_message, user_message)
+    release_db_connection()
     
-    ai_response = get_ai_response(user_message, system_message)
+    ai_response = get_ai_response(user_message, system_message, history=history)
     
     # Save chat to database
-    chat = ChatSession(
-        user_id=current_user.id,
-        message=user_message,
-        response=ai_response
-    )
-    db.session.add(chat)
-    db.session.commit()
+    save_chat(user_id, user_message, ai_response)
     
     return jsonify({'response': ai_response})
 
+def release_db_connection():
+    """Return the request's DB connection to the pool before a slow AI call
+
+    Already-loaded objects such as current_user stay usable, and the session
+    checks out a fresh connection on its next query. Without this every
+    request waiting on the LLM would pin a pooled connection.
+    """
+    db.session.close()
+
+def sse_event(data):
+    """Format a payload as a Server-Sent Event"""
+    return f"data: {json.dumps(data)}\n\n"
+
+@app.route('/ai-chat/stream', methods=['POST'])
+@login_required
+@rate_limiter.limit('chat', CHAT_RATE_LIMIT)
+def chat_with_ai_stream():
+    """Stream AI chat tokens to the browser as Server-Sent Events"""
+    user_message = request.json.get('message', '').strip()
+    
+    if not user_message:
+        return jsonify({'error': 'Please enter a message'})
+    
+    system_message = build_chat_system_message(current_user)
+    user_id = current_user.id
+    history = conversations.context(user_id, system_message, user_message)
+    release_db_connection()
+    
+    def generate():
+        # Flush headers straight away so the browser sees the first byte immediately
+        yield ": stream open\n\n"
+        
+        chunks = []
+        for token in stream_ai_response(user_message, system_message, history):
+            chunks.append(token)
+            yield sse_event({'token': token})
+        
+        # Save the completed exchange once the stream has finished
+        save_chat(user_id, user_message, ''.join(chunks))
+        
+        yield sse_event({'done': True})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/clear-chat', methods=['POST'])
 @login_required
 def clear_chat():
     """Clear chat history"""
     # Delete user's chat sessions from database
     ChatSession.query.filter_by(user_id=current_user.id).delete()
+    # Other workers notice the new timestamp and drop their cached context
+    User.query.filter_by(id=current_user.id).update({'chat_cleared_at': datetime.utcnow()})
     db.session.commit()
+    conversations.clear(current_user.id)
     return jsonify({'success': True})
 
-if __name__ == '__main__':
+# Management commands
+@app.cli.command('rescore')
+@click.option('--kind', type=click.Choice(['heart', 'stroke', 'all']), default='all', help='Which assessments to re-score')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows read, scored and written per transaction')
+@click.option('--dry-run', is_flag=True, help='Count changes without writing them')
+def rescore_command(kind, chunk_size, dry_run):
+    """Recompute score and risk level of stored assessments with the current weights"""
+    targets = [('heart', HeartAssessment, HEART), ('stroke', StrokeAssessment, STROKE)]
+    
+    def report(stats):
+        click.echo(f"{stats['table']}: {stats['processed']}/{stats['total']} rows, "
+                   f"{stats['updated']} changed, {stats['rows_per_second']:.0f} rows/s")
+    
+    for name, model, questionnaire in targets:
+        if kind in (name, 'all'):
+            stats = rescore_table(db.session, model, questionnaire, chunk_size=chunk_size, dry_run=dry_run, progress=report)
+            click.echo(f"{stats['table']}: done in {stats['elapsed']:.1f}s, {stats['updated']} rows "
+                       f"{'would change' if dry_run else 'updated'}")
+            # Risk levels may have moved, so the per-level aggregates must be recounted
+            if stats['updated'] and not dry_run:
+                rebuild_analytics(name)
+                click.echo(f'{name}: analytics rebuilt')
+
+@app.cli.command('export-user')
+@click.argument('username')
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='ndjson', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), help='Output file (default: stdout)')
+def export_user_command(username, fmt, compress, output):
+    """Export everything stored for one user"""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user named {username!r}')
+    
+    stream = open(output, 'wb') if output else click.get_binary_stream('stdout')
+    try:
+        for chunk in export_user_records(user, fmt, compress):
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
+
+@app.cli.command('rebuild-analytics')
+@click.option('--kind', type=click.Choice(['heart', 'stroke', 'all']), default='all', help='Which aggregates to rebuild')
+def rebuild_analytics_command(kind):
+    """Recompute the analytics aggregate tables from the stored assessments"""
+    for name, rows in rebuild_analytics(kind).items():
+        click.echo(f'{name}: aggregated {rows} assessments')
+
+@app.cli.command('precompute-reports')
+@click.option('--kind', type=click.Choice(['heart', 'stroke', 'all']), default='all', help='Which questionnaires to cover')
+@click.option('--force', is_flag=True, help='Regenerate sections that already exist')
+@click.option('--workers', default=4, show_default=True, help='Sections generated concurrently')
+def precompute_reports_command(kind, force, workers):
+    """Generate the per-risk-level and per-factor report sections used by REPORT_MODE=fast/hybrid"""
+    ReportSection.__table__.create(db.engine, checkfirst=True)
+    existing = {(row.questionnaire, row.section, row.key): row for row in ReportSection.query.all()}
+    
+    todo = []
+    for name in QUESTIONNAIRES:
+        if kind not in (name, 'all'):
+            continue
+        for section, key in report_library.required(name):
+            if force or (name, section, key) not in existing:
+                build = build_level_section_prompt if section == 'level' else build_factor_section_prompt
+                todo.append((name, section, key, build(name, key)))
+    
+    if not todo:
+        click.echo('All report sections are present; use --force to regenerate them')
+        return
+    
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(get_ai_response, prompt, system_message, cache=not force) for _, _, _, (prompt, system_message) in todo]
+        for (name, section, key, _), future in zip(todo, futures):
+            content = future.result()
+            if is_ai_error(content):
+                failed += 1
+                click.echo(f'{name} {section} {key}: {content}', err=True)
+                continue
+            row = existing.get((name, section, key))
+            if row is None:
+                db.session.add(ReportSection(questionnaire=name, section=section, key=key, content=content.strip(), model=OPENROUTER_MODEL))
+            else:
+                row.content, row.model, row.created_at = content.strip(), OPENROUTER_MODEL, datetime.utcnow()
+            db.session.commit()
+            click.echo(f'{name} {section} {key}: {len(content)} characters')
+    
+    click.echo(f'{len(todo) - failed} sections stored, {failed} failed')
+    report_library.reload()
+    for name in QUESTIONNAIRES:
+        if kind in (name, 'all'):
+            missing = report_library.missing(name)
+            click.echo(f"{name}: {'complete' if not missing else f'{len(missing)} sections missing'}")
+
+@app.cli.command('upgrade-db')
+@click.option('--vacuum', is_flag=True, help='Rebuild the SQLite file afterwards to return freed space to the OS')
+def upgrade_db_command(vacuum):
+    """Apply schema upgrades (init-db and the gunicorn master also run them)"""
+    upgrade_schema(progress=lambda table, rows: click.echo(f'{table}: {rows} rows converted'))
+    if vacuum and db.engine.dialect.name == 'sqlite':
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(db.text('VACUUM'))
+            # In WAL mode the rebuilt pages land in the WAL; fold them back into the main file
+            conn.execute(db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        click.echo('Database vacuumed')
+
+def upgrade_schema(progress=None):
+    """Bring tables created by earlier versions up to the current models"""
+    for model, questionnaire in ((HeartAssessment, HEART), (StrokeAssessment, STROKE)):
+        upgrade_answer_masks(db.engine, model.__tablename__, questionnaire, progress=progress)
+        add_column(db.engine, model.__tablename__, 'report_job_id', db.Integer())
+    add_column(db.engine, ReportJob.__tablename__, 'retry_at', db.DateTime())
+    add_column(db.engine, User.__tablename__, 'chat_cleared_at', db.DateTime())
+    # scrypt hashes don't fit the original 120 characters
+    widen_column(db.engine, User.__tablename__, 'password_hash', 255)
+
+def schema_problems():
+    """What the database still needs from setup_db/upgrade-db; empty when it matches the models"""
+    inspector = db.inspect(db.engine)
+    problems = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            problems.append(f'table {table.name} is missing')
+            continue
+        existing = table_columns(db.engine, table.name)
+        problems += [f'column {table.name}.{c.name} is missing' for c in table.columns if c.name not in existing]
+        if 'answers' in existing:
+            problems.append(f'{table.name}.answers has not been converted to answer masks')
+    if inspector.has_table(User.__tablename__) and column_too_narrow(db.engine, User.__tablename__, 'password_hash', 255):
+        problems.append('user.password_hash is too narrow for scrypt hashes')
+    return problems
+
+def check_schema():
+    """Refuse to serve from a database that hasn't been set up or upgraded yet"""
+    problems = schema_problems()
+    if problems:
+        raise RuntimeError('Database schema is out of date (' + '; '.join(problems) +
+                           '). Run `flask --app app init-db` before starting workers.')
+
+def setup_db():
+    """Create tables and indexes, upgrade older schemas and build missing aggregates
+
+    Not safe to run from several processes at once: call it once per
+    deploy (``flask init-db``, which gunicorn.conf.py runs in the master)
+    before starting workers.
+    """
     with app.app_context():
+        analytics_missing = not db.inspect(db.engine).has_table(AssessmentDailyStat.__tablename__)
         db.create_all()
+        upgrade_schema()
+        if analytics_missing:
+            # First start with analytics: aggregate the assessments already stored
+            rebuild_analytics()
+        # create_all skips tables that already exist, so add indexes introduced later
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+
+def init_db():
+    """Set up the database and resume unfinished background jobs (single-process servers)"""
+    setup_db()
+    with app.app_context():
+        resume_report_jobs()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and indexes and apply schema upgrades; run once before starting workers"""
+    setup_db()
+    click.echo('Database ready')
+
+if __name__ == '__main__':
+    init_db()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,153 @@
+"""Microbenchmarks for the dashboard and history queries
+
+    python benchmarks/bench_dashboard.py [--users 200] [--rows-per-user 200] [--max-dashboard-ms 5]
+
+Seeds a throwaway SQLite database with --users users, each with
+--rows-per-user heart and stroke assessments, medication analyses and
+chats. It then times the dashboard's three "recent" queries, the first
+and a deep page of /api/history, and the full /dashboard request for one
+user. Query plans are printed so a missing index shows up as a SCAN. The
+--max options make it exit with status 1 when a budget is missed.
+"""
+import argparse
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_db_dir = tempfile.mkdtemp(prefix='cardiovision-bench-')
+atexit.register(shutil.rmtree, _db_dir, True)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+from sqlalchemy import insert, text  # noqa: E402
+
+import app as cardiovision  # noqa: E402
+from scoring import HEART, STROKE, risk_level  # noqa: E402
+
+db = cardiovision.db
+
+
+def seed(n_users, rows_per_user):
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    db.session.execute(insert(cardiovision.User), [{
+        'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password_hash': 'x',
+        'first_name': 'Bench', 'last_name': str(i), 'created_at': now,
+    } for i in range(n_users)])
+
+    def assessment_rows(questionnaire, user_id):
+        for _ in range(rows_per_user):
+            answers = {key: rng.choice(('yes', 'no')) for key in questionnaire.keys}
+            score = questionnaire.score(answers)
+            yield {'user_id': user_id, 'score': score, 'risk_level': risk_level(score),
+                   'answer_mask': questionnaire.encode_mask(answers), 'schema_version': questionnaire.version,
+                   'ai_report': 'Report text ' * 40,
+                   'created_at': now - timedelta(minutes=rng.randrange(525600))}
+
+    for user_id in range(1, n_users + 1):
+        db.session.execute(insert(cardiovision.HeartAssessment), list(assessment_rows(HEART, user_id)))
+        db.session.execute(insert(cardiovision.StrokeAssessment), list(assessment_rows(STROKE, user_id)))
+        db.session.execute(insert(cardiovision.MedicationAnalysis), [{
+            'user_id': user_id, 'medications': 'aspirin, warfarin', 'ai_analysis': 'Analysis text ' * 40,
+            'created_at': now - timedelta(minutes=rng.randrange(525600)),
+        } for _ in range(rows_per_user)])
+        db.session.execute(insert(cardiovision.ChatSession), [{
+            'user_id': user_id, 'message': 'How is my heart?', 'response': 'Answer text ' * 40,
+            'created_at': now - timedelta(minutes=rng.randrange(525600)),
+        } for _ in range(rows_per_user)])
+    db.session.commit()
+
+
+def recent_queries(user_id):
+    for model in (cardiovision.HeartAssessment, cardiovision.StrokeAssessment, cardiovision.MedicationAnalysis):
+        yield model.__tablename__, (
+            model.query.filter_by(user_id=user_id).order_by(model.created_at.desc()).limit(5)
+        )
+
+
+def timed(fn, repeat):
+    """Median milliseconds per call"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def query_plan(statement):
+    compiled = statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).all()
+    return [row[-1] for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rows-per-user', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=200, help='Timed runs per query (median is reported)')
+    parser.add_argument('--max-dashboard-ms', type=float, help='Fail if the three dashboard queries take longer')
+    parser.add_argument('--max-history-ms', type=float, help='Fail if a history page takes longer')
+    parser.add_argument('--show-plans', action='store_true', help='Print SQLite query plans')
+    args = parser.parse_args()
+
+    cardiovision.init_db()
+    with cardiovision.app.app_context():
+        started = time.perf_counter()
+        seed(args.users, args.rows_per_user)
+        print(f'Seeded {args.users} users x {args.rows_per_user} rows per table in {time.perf_counter() - started:.1f}s')
+
+        user_id = args.users // 2
+        results = {}
+        for name, query in recent_queries(user_id):
+            results[f'recent {name}'] = timed(query.all, args.repeat)
+            if args.show_plans:
+                print(f'{name}: {"; ".join(query_plan(query.statement))}')
+        dashboard_ms = sum(results.values())
+
+        first_page = cardiovision.history_query(user_id, 20, None)
+        rows = db.session.execute(first_page).all()
+        results['history page 1'] = timed(lambda: db.session.execute(first_page).all(), args.repeat)
+        cursor = (rows[-1].created_at, rows[-1].kind, rows[-1].id)
+        for _ in range(min(20, args.rows_per_user // 20)):
+            page = db.session.execute(cardiovision.history_query(user_id, 20, cursor)).all()
+            if not page:
+                break
+            cursor = (page[-1].created_at, page[-1].kind, page[-1].id)
+        deep_page = cardiovision.history_query(user_id, 20, cursor)
+        results['history deep page'] = timed(lambda: db.session.execute(deep_page).all(), args.repeat)
+        if args.show_plans:
+            print(f'history: {"; ".join(query_plan(deep_page))}')
+
+    client = cardiovision.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    assert client.get('/dashboard').status_code == 200
+    results['GET /dashboard'] = timed(lambda: client.get('/dashboard'), max(10, args.repeat // 4))
+
+    for name, ms in results.items():
+        print(f'{name:<36} {ms:8.3f} ms')
+    print(f"{'dashboard queries total':<36} {dashboard_ms:8.3f} ms")
+
+    failures = []
+    if args.max_dashboard_ms and dashboard_ms > args.max_dashboard_ms:
+        failures.append(f'dashboard queries {dashboard_ms:.3f} ms > {args.max_dashboard_ms} ms')
+    history_ms = max(results['history page 1'], results['history deep page'])
+    if args.max_history_ms and history_ms > args.max_history_ms:
+        failures.append(f'history page {history_ms:.3f} ms > {args.max_history_ms} ms')
+    for failure in failures:
+        print(f'FAIL {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
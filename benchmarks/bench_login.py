@@ -0,0 +1,79 @@
+"""Password verification cost, i.e. logins per second per core, for each hashing method
+
+    python benchmarks/bench_login.py [--methods pbkdf2:sha256:600000,scrypt:32768:8:1] [--workers 2]
+                                     [--min-per-core 5]
+
+For every method, times one verification on this process (the cost a login
+adds to a request worker when PASSWORD_HASH_WORKERS=0), then pushes a
+burst of concurrent verifications through a pool of --workers processes as
+the app does and reports the throughput. --min-per-core turns it into a gate
+that exits with status 1 when a method verifies fewer logins per second per
+core than the budget, which catches a cost set too high for the hardware.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher  # noqa: E402
+
+DEFAULT_METHODS = 'pbkdf2:sha256:600000,pbkdf2:sha256:260000,scrypt:32768:8:1,scrypt:16384:8:1'
+
+
+def bench(method, workers, burst, repeat=5):
+    inline = PasswordHasher(method)
+    stored = inline.hash('correct horse battery staple')
+    single = min(_timed(lambda: inline.verify(stored, 'correct horse battery staple')) for _ in range(repeat))
+
+    pooled = PasswordHasher(method, workers=workers)
+    pooled.verify(stored, 'warm up')  # start the worker processes outside the timing
+    with ThreadPoolExecutor(max_workers=burst) as callers:
+        started = time.perf_counter()
+        results = list(callers.map(lambda _: pooled.verify(stored, 'correct horse battery staple'), range(burst)))
+        elapsed = time.perf_counter() - started
+    pooled.shutdown()
+
+    return {
+        'hash_length': len(stored),
+        'verify_ms': single * 1000,
+        'per_core': 1 / single,
+        'pool_per_s': burst / elapsed,
+        'ok': all(results),
+    }
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', default=DEFAULT_METHODS, help='Comma-separated Werkzeug method strings')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes in the hashing pool')
+    parser.add_argument('--burst', type=int, default=40, help='Concurrent logins pushed through the pool')
+    parser.add_argument('--min-per-core', type=float, help='Fail if a method verifies fewer logins/s per core')
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{os.cpu_count()} cores, {args.workers} hashing processes, bursts of {args.burst}")
+    print(f"{'method':<24} {'hash chars':>10} {'verify ms':>10} {'logins/s/core':>14} {'pool logins/s':>14}")
+    for method in args.methods.split(','):
+        r = bench(method, args.workers, args.burst)
+        print(f"{method:<24} {r['hash_length']:>10} {r['verify_ms']:>10.1f} {r['per_core']:>14.1f} {r['pool_per_s']:>14.1f}")
+        if not r['ok']:
+            failures.append(f"{method}: pooled verification rejected a correct password")
+        if args.min_per_core and r['per_core'] < args.min_per_core:
+            failures.append(f"{method}: {r['per_core']:.1f} logins/s per core < {args.min_per_core}")
+
+    for failure in failures:
+        print(f'FAIL {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
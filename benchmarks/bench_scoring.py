@@ -0,0 +1,77 @@
+"""Microbenchmarks for the questionnaire scoring functions
+
+    python benchmarks/bench_scoring.py [--rows 100000] [--max-single-us 20] [--min-batch-rows-per-s 1e6]
+
+Times single-row scoring (the request path), encoding answer dicts, and
+vectorized batch scoring (rescore and the batch CLI), and checks that the
+batch and single-row paths agree. The --max/--min options turn it into a
+regression gate: the script exits with status 1 when a budget is missed.
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scoring import QUESTIONNAIRES, risk_level, risk_levels  # noqa: E402
+
+
+def best_of(statement, number, repeat=5):
+    """Best per-call time in seconds over several runs"""
+    return min(timeit.repeat(statement, number=number, repeat=repeat)) / number
+
+
+def bench(questionnaire, rows):
+    rng = random.Random(42)
+    answers = [{key: rng.choice(('yes', 'no')) for key in questionnaire.keys} for _ in range(rows)]
+    sample = answers[0]
+    matrix = questionnaire.encode_many(answers)
+
+    single = best_of(lambda: questionnaire.score(sample), 20000)
+    single_level = best_of(lambda: risk_level(questionnaire.score(sample)), 20000)
+    encode = best_of(lambda: questionnaire.encode_many(answers), 1, repeat=3) / rows
+    batch = best_of(lambda: questionnaire.score_batch(matrix), 3)
+    batch_levels = best_of(lambda: risk_levels(questionnaire.score_batch(matrix)), 3)
+
+    scores = questionnaire.score_batch(matrix)
+    mismatches = sum(int(scores[i]) != questionnaire.score(answers[i]) for i in range(min(rows, 10000)))
+    return {
+        'single_us': single * 1e6,
+        'single_with_level_us': single_level * 1e6,
+        'encode_us_per_row': encode * 1e6,
+        'batch_rows_per_s': rows / batch,
+        'batch_with_levels_rows_per_s': rows / batch_levels,
+        'mismatches': mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='Answer sets in the batch benchmarks')
+    parser.add_argument('--max-single-us', type=float, help='Fail if single-row scoring is slower than this')
+    parser.add_argument('--min-batch-rows-per-s', type=float, help='Fail if batch scoring is slower than this')
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'questionnaire':<14} {'single us':>10} {'+level us':>10} {'encode us/row':>14} "
+          f"{'batch rows/s':>14} {'+levels rows/s':>15}")
+    for name, questionnaire in sorted(QUESTIONNAIRES.items()):
+        r = bench(questionnaire, args.rows)
+        print(f"{name:<14} {r['single_us']:>10.2f} {r['single_with_level_us']:>10.2f} {r['encode_us_per_row']:>14.2f} "
+              f"{r['batch_rows_per_s']:>14,.0f} {r['batch_with_levels_rows_per_s']:>15,.0f}")
+        if r['mismatches']:
+            failures.append(f"{name}: batch and single-row scores differ on {r['mismatches']} rows")
+        if args.max_single_us and r['single_us'] > args.max_single_us:
+            failures.append(f"{name}: single-row scoring {r['single_us']:.2f} us > {args.max_single_us} us")
+        if args.min_batch_rows_per_s and r['batch_rows_per_s'] < args.min_batch_rows_per_s:
+            failures.append(f"{name}: batch scoring {r['batch_rows_per_s']:,.0f} rows/s < {args.min_batch_rows_per_s:,.0f}")
+
+    for failure in failures:
+        print(f'FAIL {failure}', file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
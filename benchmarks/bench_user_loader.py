@@ -0,0 +1,78 @@
+"""Queries per authenticated request with and without the user cache
+
+    python benchmarks/bench_user_loader.py [--requests 500]
+
+Logs in once, then requests pages that need nothing from the database
+except the logged-in user, counting SQL statements with a SQLAlchemy
+event hook. Runs against a throwaway SQLite database.
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_db_dir = tempfile.mkdtemp(prefix='cardiovision-bench-')
+atexit.register(shutil.rmtree, _db_dir, True)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault('APP_SECRET_KEY', 'benchmark')
+
+from sqlalchemy import event  # noqa: E402
+
+import app as cardiovision  # noqa: E402
+
+PAGES = ['/heart-attack', '/stroke', '/medication-analysis', '/ai-chat']
+
+
+def run(client, n_requests):
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    with cardiovision.app.app_context():
+        engine = cardiovision.db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        started = time.perf_counter()
+        for i in range(n_requests):
+            response = client.get(PAGES[i % len(PAGES)])
+            assert response.status_code == 200, response.status_code
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return statements / n_requests, n_requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    cardiovision.init_db()
+    client = cardiovision.app.test_client()
+    client.post('/register', data={
+        'username': 'bench', 'email': 'bench@example.com', 'password': 'bench',
+        'first_name': 'Bench', 'last_name': 'User'
+    })
+    client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+    ttl = cardiovision.user_cache.ttl or 300
+    results = []
+    for label, cache_ttl in (('no cache', 0), ('user cache', ttl)):
+        cardiovision.user_cache.ttl = cache_ttl
+        cardiovision.user_cache.clear()
+        results.append((label, *run(client, args.requests)))
+
+    print(f"{'mode':<12} {'queries/request':>16} {'requests/s':>12}")
+    for label, queries, rate in results:
+        print(f"{label:<12} {queries:>16.2f} {rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
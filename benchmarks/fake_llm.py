@@ -0,0 +1,148 @@
+"""Local stand-in for the OpenRouter chat completions API
+
+    python benchmarks/fake_llm.py [--port 8090] [--latency 1.5] [--jitter 0.5]
+
+Answers POST /v1/chat/completions with canned text after a configurable
+delay, streams Server-Sent Events when the request asks for them, and can
+fail a fraction of calls with 503 to exercise retries and the circuit
+breaker. Point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:8090/v1.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = ('Based on the answers provided, the main modifiable risk factors are blood pressure, '
+         'physical activity and diet. Discuss screening options with your doctor and seek urgent '
+         'care for chest pain, sudden weakness or difficulty speaking.')
+
+
+class FakeLLMConfig:
+    def __init__(self, latency=1.0, jitter=0.0, first_token=0.3, chunks=20, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.first_token = first_token
+        self.chunks = chunks
+        self.error_rate = error_rate
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def delay(self, base):
+        return max(0.0, base + random.uniform(-self.jitter, self.jitter))
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = FakeLLMConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        config = self.config
+        with config.lock:
+            config.calls += 1
+
+        if random.random() < config.error_rate:
+            time.sleep(config.delay(config.first_token))
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        prompt = body.get('messages', [{}])[-1].get('content', '')
+        usage = {'prompt_tokens': len(prompt) // 4 + 1, 'completion_tokens': len(REPLY) // 4 + 1}
+
+        if body.get('stream'):
+            self._stream(usage)
+            return
+
+        time.sleep(config.delay(config.latency))
+        payload = json.dumps({
+            'id': f'fake-{config.calls}',
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': REPLY}, 'finish_reason': 'stop'}],
+            'usage': usage,
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _stream(self, usage):
+        config = self.config
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        words = REPLY.split(' ')
+        per_chunk = max(1, len(words) // max(1, config.chunks))
+        # Spread the rest of the latency budget over the chunks after the first token
+        gap = max(0.0, config.latency - config.first_token) / max(1, len(words) // per_chunk)
+        time.sleep(config.delay(config.first_token))
+        try:
+            for start in range(0, len(words), per_chunk):
+                text = ' '.join(words[start:start + per_chunk]) + ' '
+                chunk = {'choices': [{'index': 0, 'delta': {'content': text}}]}
+                self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+                self.wfile.flush()
+                time.sleep(gap)
+            final = {'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}], 'usage': usage}
+            self.wfile.write(f'data: {json.dumps(final)}\n\ndata: [DONE]\n\n'.encode())
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server(host='127.0.0.1', port=0, **config):
+    """Start the fake API in a daemon thread; returns (server, base_url)"""
+    handler = type('ConfiguredFakeLLMHandler', (FakeLLMHandler,), {'config': FakeLLMConfig(**config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-llm', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}/v1'
+
+
+def add_arguments(parser):
+    parser.add_argument('--latency', type=float, default=1.0, help='Seconds per completion (default 1.0)')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Random +/- seconds added to each delay')
+    parser.add_argument('--first-token', type=float, default=0.3, help='Seconds before the first streamed chunk')
+    parser.add_argument('--chunks', type=int, default=20, help='Chunks per streamed reply')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of calls answered with 503')
+
+
+def config_from_args(args):
+    return {
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'first_token': args.first_token,
+        'chunks': args.chunks,
+        'error_rate': args.error_rate,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, url = start_server(args.host, args.port, **config_from_args(args))
+    print(f'Fake OpenRouter listening at {url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
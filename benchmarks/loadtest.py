@@ -0,0 +1,353 @@
+"""End-to-end load test against a local fake LLM
+
+    python benchmarks/loadtest.py [--users 50] [--duration 60] [--server gunicorn]
+    python benchmarks/loadtest.py --url http://staging:8000 --users 20   # existing deployment
+
+Starts the fake OpenRouter API (benchmarks/fake_llm.py) and the app on a
+throwaway SQLite database, then runs --users virtual users concurrently.
+Each one registers, logs in and loops over a weighted mix of dashboard,
+assessment, chat and history requests until --duration runs out.
+
+Prints throughput and latency percentiles per request type, plus how much
+the database grew. --json writes the same numbers to a file so runs can be
+compared before a deploy.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_llm import add_arguments, config_from_args, start_server  # noqa: E402
+from scoring import HEART, STROKE  # noqa: E402
+
+DEFAULT_MIX = 'dashboard=35,heart=15,stroke=10,chat=15,chat_stream=10,history=15'
+
+CHAT_MESSAGES = [
+    'How can I lower my blood pressure without medication?',
+    'What does a moderate heart attack risk mean for me?',
+    'Is it safe to exercise after a stroke risk assessment?',
+    'Which foods help with cholesterol?',
+    'How much sleep do I need for heart health?',
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {name!r}; choose from {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def random_answers(questionnaire, p_yes=0.3):
+    return {key: 'yes' if random.random() < p_yes else 'no' for key in questionnaire.keys}
+
+
+def op_dashboard(session, base):
+    return session.get(f'{base}/dashboard'), None
+
+
+def op_heart(session, base):
+    return session.post(f'{base}/heart-attack', data=random_answers(HEART)), None
+
+
+def op_stroke(session, base):
+    return session.post(f'{base}/stroke', data=random_answers(STROKE)), None
+
+
+def op_history(session, base):
+    return session.get(f'{base}/api/history', params={'limit': 20}), None
+
+
+def op_chat(session, base):
+    response = session.post(f'{base}/ai-chat', json={'message': random.choice(CHAT_MESSAGES)})
+    error = None
+    if response.ok:
+        body = response.json()
+        text = body.get('response') or ''
+        if 'error' in body or text.startswith('Error getting AI response'):
+            error = body.get('error') or text[:80]
+    return response, error
+
+
+def op_chat_stream(session, base):
+    started = time.perf_counter()
+    response = session.post(f'{base}/ai-chat/stream', json={'message': random.choice(CHAT_MESSAGES)}, stream=True)
+    first_byte = None
+    error = None
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            if line.startswith('data: ') and 'Error getting AI response' in line:
+                error = 'stream error'
+    response.first_byte = first_byte
+    return response, error
+
+
+OPERATIONS = {
+    'dashboard': op_dashboard,
+    'heart': op_heart,
+    'stroke': op_stroke,
+    'chat': op_chat,
+    'chat_stream': op_chat_stream,
+    'history': op_history,
+}
+
+
+class Recorder:
+    """Thread-safe latency samples and error counts per operation"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.first_bytes = []
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, error=None, first_byte=None):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if error:
+                self.errors.setdefault(name, {}).setdefault(error, 0)
+                self.errors[name][error] += 1
+            if first_byte is not None:
+                self.first_bytes.append(first_byte)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        'count': len(values),
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+        'max': values[-1] if values else None,
+    }
+
+
+def timed(recorder, name, call):
+    started = time.perf_counter()
+    try:
+        response, error = call()
+    except requests.RequestException as e:
+        recorder.record(name, time.perf_counter() - started, type(e).__name__)
+        return None
+    elapsed = time.perf_counter() - started
+    if error is None and response.status_code >= 400:
+        error = f'HTTP {response.status_code}'
+    recorder.record(name, elapsed, error, getattr(response, 'first_byte', None))
+    return response
+
+
+def virtual_user(index, base, run_id, mix, deadline, recorder, think_time):
+    session = requests.Session()
+    username = f'load-{run_id}-{index}'
+    password = 'load-test-password'
+
+    timed(recorder, 'register', lambda: (session.post(f'{base}/register', data={
+        'username': username, 'email': f'{username}@example.com', 'password': password,
+        'first_name': 'Load', 'last_name': f'User{index}', 'date_of_birth': '1970-01-01',
+    }), None))
+    response = timed(recorder, 'login', lambda: (session.post(f'{base}/login', data={
+        'username': username, 'password': password,
+    }), None))
+    if response is None or '/login' in response.url:
+        recorder.record('login', 0.0, 'login failed')
+        return
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        name = random.choices(names, weights)[0]
+        timed(recorder, name, lambda: OPERATIONS[name](session, base))
+        if think_time:
+            time.sleep(random.expovariate(1 / think_time))
+
+
+def database_size(path):
+    if not path:
+        return None
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+def table_counts(path):
+    if not path or not os.path.exists(path):
+        return {}
+    conn = sqlite3.connect(path)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+
+def start_app(args, llm_url, db_path):
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f'sqlite:///{db_path}',
+        'OPENROUTER_BASE_URL': llm_url,
+        'OPENROUTER_API_KEY': env.get('OPENROUTER_API_KEY') or 'fake-key',
+        'APP_SECRET_KEY': env.get('APP_SECRET_KEY') or 'load-test',
+        'BIND': f'127.0.0.1:{port}',
+        'WEB_WORKERS': str(args.workers),
+    })
+    # Measure capacity rather than the per-user limits, unless they are set explicitly
+    env.setdefault('CHAT_RATE_LIMIT', '0')
+    env.setdefault('MEDICATION_RATE_LIMIT', '0')
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application']
+    else:
+        command = [sys.executable, '-c',
+                   'import app; app.init_db(); '
+                   f'app.app.run(host="127.0.0.1", port={port}, threaded=True, use_reloader=False)']
+    log = open(os.path.join(os.path.dirname(db_path), 'server.log'), 'w')
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            if requests.get(f'{base}/', timeout=1).status_code == 200:
+                return process, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    log.close()
+    with open(log.name) as f:
+        sys.exit(f'App server did not start:\n{f.read()[-4000:]}')
+
+
+def print_report(report):
+    print(f"\n{report['users']} users for {report['duration']:.0f}s: "
+          f"{report['requests']} requests, {report['throughput']:.1f} req/s, {report['errors']} errors")
+    print(f"{'operation':<12} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, stats in sorted(report['operations'].items()):
+        ms = [f"{stats[k] * 1000:9.0f}" if stats[k] is not None else f"{'-':>9}" for k in ('p50', 'p95', 'p99', 'max')]
+        print(f"{name:<12} {stats['count']:>7} {stats['errors']:>7} {' '.join(ms)}")
+    if report['stream_first_byte']['count']:
+        fb = report['stream_first_byte']
+        print(f"chat_stream time to first byte: p50 {fb['p50'] * 1000:.0f} ms, p95 {fb['p95'] * 1000:.0f} ms")
+    for name, errors in sorted(report['error_detail'].items()):
+        for error, count in sorted(errors.items(), key=lambda item: -item[1])[:3]:
+            print(f'  {name}: {count} x {error}')
+    if report['db_bytes_after'] is not None:
+        growth = report['db_bytes_after'] - report['db_bytes_before']
+        print(f"Database: {report['db_bytes_before'] / 1024:.0f} KiB -> {report['db_bytes_after'] / 1024:.0f} KiB "
+              f"(+{growth / 1024:.0f} KiB, {growth / max(1, report['requests']):.0f} bytes/request)")
+        for table, rows in sorted(report['db_rows'].items()):
+            print(f'  {table}: {rows} rows')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of steady traffic')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which users start')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean pause between a user\'s requests')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help=f'Weighted operations (default {DEFAULT_MIX})')
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn',
+                        help='gunicorn + gevent (wsgi.py) or the threaded Flask server')
+    parser.add_argument('--workers', type=int, default=1, help='Gunicorn worker processes')
+    parser.add_argument('--url', help='Test an already running app instead of starting one')
+    parser.add_argument('--db', help='SQLite file of the app under --url, for DB growth figures')
+    parser.add_argument('--json', help='Also write the results to this file')
+    add_arguments(parser)
+    args = parser.parse_args()
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix='cardiovision-load-')
+    process = None
+    try:
+        if args.url:
+            base, db_path = args.url.rstrip('/'), args.db
+        else:
+            llm_server, llm_url = start_server(**config_from_args(args))
+            print(f'Fake LLM at {llm_url} (latency {args.latency}s, error rate {args.error_rate:.0%})')
+            db_path = os.path.join(workdir, 'load.db')
+            process, base = start_app(args, llm_url, db_path)
+            print(f'App ({args.server}) at {base}, database {db_path}')
+
+        db_before = database_size(db_path)
+        recorder = Recorder()
+        run_id = uuid.uuid4().hex[:8]
+        started = time.monotonic()
+        deadline = started + args.ramp_up + args.duration
+        threads = []
+        for index in range(args.users):
+            thread = threading.Thread(target=virtual_user, daemon=True,
+                                      args=(index, base, run_id, args.mix, deadline, recorder, args.think_time))
+            threads.append(thread)
+            thread.start()
+            time.sleep(args.ramp_up / max(1, args.users))
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        with recorder.lock:
+            operations = {name: {**summarize(values), 'errors': sum(recorder.errors.get(name, {}).values())}
+                          for name, values in recorder.samples.items()}
+            total = sum(len(values) for values in recorder.samples.values())
+            report = {
+                'users': args.users,
+                'duration': elapsed,
+                'requests': total,
+                'throughput': total / elapsed,
+                'errors': sum(stats['errors'] for stats in operations.values()),
+                'operations': operations,
+                'stream_first_byte': summarize(recorder.first_bytes),
+                'error_detail': recorder.errors,
+                'db_bytes_before': db_before,
+                'db_bytes_after': database_size(db_path),
+                'db_rows': table_counts(db_path),
+            }
+
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Per-user conversation context for the AI chat"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+
+class Conversation:
+    """Recent turns of one user's chat plus a rolling summary of older ones
+
+    Turns are (id, message, response) tuples; id is None for a turn this
+    process recorded before learning its database id.
+    """
+
+    def __init__(self, turns, max_turns, version):
+        self.turns = deque(turns, maxlen=max_turns)
+        self.summary = ''
+        self.compacting = False
+        self.version = version
+        self.synced_id = max((turn[0] for turn in self.turns if turn[0] is not None), default=0)
+        self.synced_at = time.monotonic()
+        self.compacted_pending = []
+        # Ids folded into the summary that a later sync (after synced_id) could fetch again
+        self.compacted_ids = set()
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """In-memory ring buffers of recent chat turns, trimmed to a token budget.
+
+    The first time a user is seen, ``loader(user_id, limit)`` fetches their
+    most recent turns, oldest first, as (id, message, response) tuples.
+    Turns are then appended in memory, and ``loader(user_id, limit, after_id)``
+    picks up turns stored by other processes at most every ``sync_interval``
+    seconds. ``version(user_id)``, if given, is checked on every use; when it
+    changes (the chat was cleared, possibly by another process) the cached
+    turns and summary are dropped and reloaded. When building a prompt,
+    the newest turns that fit in ``token_budget`` are sent verbatim. Once at
+    least ``compact_after`` older turns have fallen out of the window,
+    ``summarizer(previous_summary, turns)`` folds them into the rolling
+    summary, on ``executor`` if one is given, and they are dropped from the
+    buffer. Prompt size therefore stays bounded however long the chat runs.
+    """
+
+    def __init__(self, loader, summarizer, token_budget=2000, max_turns=64, compact_after=6,
+                 max_users=1000, executor=None, version=None, sync_interval=0):
+        self.loader = loader
+        self.summarizer = summarizer
+        self.version = version
+        self.sync_interval = sync_interval
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.compact_after = compact_after
+        self.max_users = max_users
+        self.executor = executor
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, user_id, refresh=True):
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+        if conversation is not None and not refresh:
+            return conversation
+
+        version = self.version(user_id) if self.version else None
+        with self._lock:
+            conversation = self._conversations.get(user_id)
+            if conversation is not None and conversation.version != version:
+                # Cleared since we loaded it
+                del self._conversations[user_id]
+                conversation = None
+            if conversation is not None:
+                self._conversations.move_to_end(user_id)
+        if conversation is not None:
+            if time.monotonic() - conversation.synced_at >= self.sync_interval:
+                self._sync(user_id, conversation)
+            return conversation
+
+        conversation = Conversation(self.loader(user_id, self.max_turns), self.max_turns, version)
+        with self._lock:
+            # Another request may have loaded it meanwhile; keep the first one
+            conversation = self._conversations.setdefault(user_id, conversation)
+            self._conversations.move_to_end(user_id)
+            while len(self._conversations) > self.max_users:
+                self._conversations.popitem(last=False)
+        return conversation
+
+    def _sync(self, user_id, conversation):
+        """Add turns other processes have stored since the last sync"""
+        with conversation.lock:
+            after_id = conversation.synced_id
+        new_turns = self.loader(user_id, self.max_turns, after_id)
+        with conversation.lock:
+            conversation.synced_at = time.monotonic()
+            known = {turn[0] for turn in conversation.turns} | conversation.compacted_ids
+            added = False
+            for turn_id, message, response in new_turns:
+                conversation.synced_id = max(conversation.synced_id, turn_id)
+                if turn_id in known:
+                    continue
+                if (message, response) in conversation.compacted_pending:
+                    # Our own turn, already folded into the summary before its id was known
+                    conversation.compacted_pending.remove((message, response))
+                    continue
+                pending = next((i for i, turn in enumerate(conversation.turns)
+                                if turn[0] is None and turn[1:] == (message, response)), None)
+                if pending is not None:
+                    conversation.turns[pending] = (turn_id, message, response)
+                else:
+                    conversation.turns.append((turn_id, message, response))
+                    added = True
+            conversation.compacted_ids = {i for i in conversation.compacted_ids if i > conversation.synced_id}
+            if added:
+                # Other processes' turns can predate ours; keep the buffer in id order, unsaved turns last
+                ordered = sorted(conversation.turns, key=lambda turn: (turn[0] is None, turn[0] or 0))
+                conversation.turns = deque(ordered, maxlen=self.max_turns)
+
+    def context(self, user_id, system_message, user_message):
+        """Return the history messages to send between the system message and the new message"""
+        conversation = self._get(user_id)
+        with conversation.lock:
+            turns = list(conversation.turns)
+            summary = conversation.summary
+
+        budget = self.token_budget - estimate_tokens(system_message) - estimate_tokens(user_message)
+        if summary:
+            budget -= estimate_tokens(summary)
+
+        window = []
+        for _, message, response in reversed(turns):
+            cost = estimate_tokens(message) + estimate_tokens(response)
+            if cost > budget:
+                break
+            budget -= cost
+            window.append((message, response))
+        window.reverse()
+
+        overflow = turns[:len(turns) - len(window)]
+        if len(overflow) >= self.compact_after:
+            self._compact(conversation, overflow)
+
+        messages = []
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        for message, response in window:
+            messages.append({"role": "user", "content": message})
+            messages.append({"role": "assistant", "content": response})
+        return messages
+
+    def append(self, user_id, message, response, turn_id=None):
+        """Record a completed turn, with its database id if it is already known"""
+        conversation = self._get(user_id, refresh=False)
+        with conversation.lock:
+            if turn_id is None or turn_id not in {turn[0] for turn in conversation.turns}:
+                conversation.turns.append((turn_id, message, response))
+
+    def clear(self, user_id):
+        """Forget a user's turns and summary"""
+        with self._lock:
+            self._conversations.pop(user_id, None)
+
+    def _compact(self, conversation, turns):
+        with conversation.lock:
+            if conversation.compacting:
+                return
+            conversation.compacting = True
+            previous_summary = conversation.summary
+
+        def run():
+            try:
+                summary = self.summarizer(previous_summary, [turn[1:] for turn in turns])
+            except Exception:
+                # Keep the turns; the next request will try again
+                summary = None
+            with conversation.lock:
+                if summary:
+                    conversation.summary = summary
+                    compacted = {id(turn) for turn in turns}
+                    for turn in conversation.turns:
+                        if id(turn) not in compacted:
+                            continue
+                        if turn[0] is None:
+                            conversation.compacted_pending.append(turn[1:])
+                        elif turn[0] > conversation.synced_id:
+                            conversation.compacted_ids.add(turn[0])
+                    # A sync may have reordered the buffer meanwhile, so don't assume they are at the front
+                    conversation.turns = deque((turn for turn in conversation.turns if id(turn) not in compacted),
+                                               maxlen=self.max_turns)
+                conversation.compacting = False
+
+        if self.executor is not None:
+            self.executor.submit(run)
+        else:
+            run()
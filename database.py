@@ -0,0 +1,123 @@
+"""Database configuration: connection URI, SQLite tuning and group commit"""
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, insert
+from sqlalchemy.engine import Engine
+
+DEFAULT_DATABASE_URL = 'sqlite:///cardiovision.db'
+
+
+def configure_database(app):
+    """Set the database URI and engine options from the environment.
+
+    DATABASE_URL selects the database (SQLite by default; any SQLAlchemy URL
+    such as postgresql://... works without code changes). SQLite connections
+    get the pragmas from sqlite_pragmas() applied as they are opened.
+    """
+    url = os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL)
+    # Heroku-style URLs use the scheme SQLAlchemy dropped in 1.4
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+
+    if not url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+            'pool_pre_ping': True,
+        }
+
+
+def sqlite_pragmas():
+    """Pragmas applied to every SQLite connection"""
+    return {
+        # Readers don't block the writer and vice versa
+        'journal_mode': 'WAL',
+        # With WAL, fsync on checkpoint instead of every commit; still crash-safe
+        'synchronous': 'NORMAL',
+        # Wait for a lock instead of failing with "database is locked"
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+class GroupCommitWriter:
+    """Batch inserts from many requests into a few transactions.
+
+    ``submit`` queues a row and returns immediately. A background thread
+    collects up to ``max_batch`` rows, waiting at most ``max_delay`` seconds
+    after the first one, and writes them with one executemany INSERT and one
+    commit. Rows still buffered when the process is killed are lost, so only
+    use it for data where that window (``max_delay``) is acceptable.
+    """
+
+    def __init__(self, app, db, model, max_batch=100, max_delay=0.05):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                    self._thread.start()
+
+    def submit(self, **values):
+        """Queue one row for insertion"""
+        values.setdefault('created_at', datetime.utcnow())
+        self._ensure_started()
+        self._queue.put(values)
+
+    def flush(self):
+        """Block until every queued row has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                with self.app.app_context():
+                    self.db.session.execute(insert(self.model), batch)
+                    self.db.session.commit()
+            except Exception:
+                self.app.logger.exception('Group commit of %d %s rows failed', len(batch), self.model.__name__)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,41 @@
+"""Gunicorn settings for the gevent serving mode (see wsgi.py)"""
+import multiprocessing
+import os
+import glob
+import subprocess
+import sys
+import tempfile
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_WORKERS', str(multiprocessing.cpu_count())))
+worker_class = 'gevent'
+
+# Concurrent requests (greenlets) per worker process
+worker_connections = int(os.getenv('WORKER_CONNECTIONS', '2000'))
+
+# Streaming chat responses and slow LLM calls must not be killed by the worker timeout
+timeout = int(os.getenv('WORKER_TIMEOUT', '120'))
+keepalive = 5
+
+# Size the LLM keep-alive pool for the number of greenlets that may call it at once
+os.environ.setdefault('LLM_POOL_SIZE', str(worker_connections))
+
+# Workers share metric snapshots here so /metrics covers all of them, whichever worker answers
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='cardiovision-metrics-'))
+
+# Hash passwords in a helper process per worker, so login bursts don't stall the event loop
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '1')
+
+
+def on_starting(server):
+    """Create and upgrade the database once, in the master, before any worker boots"""
+    # Snapshots from a previous run would otherwise be added to this run's totals
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], '*.json')):
+        os.remove(path)
+    if os.getenv('DB_SETUP_ON_START', '1') == '0':
+        # The deploy step runs `flask --app app init-db` itself
+        return
+    # In a child process: importing the app here would load socket and threading into the
+    # master before wsgi.py monkey-patches them in the forked workers
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
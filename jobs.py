@@ -0,0 +1,55 @@
+"""Background worker pool for AI report generation"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReportWorkerPool:
+    """Run report jobs on a bounded pool of worker threads.
+
+    The pool only knows about job ids; ``runner`` is called with a job id
+    inside an application context and is responsible for loading the job
+    from the database, doing the work and recording the outcome.
+    """
+
+    def __init__(self, app, runner, max_workers=4):
+        self.app = app
+        self.runner = runner
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so pre-forking servers don't start threads in the master
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix='report-worker'
+                    )
+        return self._executor
+
+    def submit(self, job_id):
+        """Queue a job for execution"""
+        return self._get_executor().submit(self._run, job_id)
+
+    def submit_later(self, job_id, delay):
+        """Queue a job after ``delay`` seconds, e.g. to retry it with backoff"""
+        timer = threading.Timer(max(delay, 0), self.submit, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                self.runner(job_id)
+            except Exception:
+                self.app.logger.exception('Report job %s failed', job_id)
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
@@ -0,0 +1,310 @@
+"""Pooled HTTP client for the OpenRouter chat completions API"""
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class LLMError(Exception):
+    """Raised when the LLM provider cannot produce a response"""
+
+
+class CircuitOpenError(LLMError):
+    """Raised without contacting the provider while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    every call is rejected for ``reset_timeout`` seconds. Then a single
+    trial call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """Return True if a call may be attempted now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+            # Half-open: only one trial call at a time
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class LLMClient:
+    """Chat completions client with a keep-alive connection pool.
+
+    Every call uses connect/read timeouts, transient failures (connection
+    errors, timeouts, 429 and 5xx responses) are retried with jittered
+    exponential backoff, and a circuit breaker rejects calls immediately
+    while the provider is down.
+    """
+
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, base_url, api_key, model, connect_timeout=5.0, read_timeout=60.0,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0, pool_size=20,
+                 failure_threshold=5, reset_timeout=30.0, temperature=0.7, max_tokens=1000):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._counters = {'calls': 0, 'attempts': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+
+        # Callables observer(mode, seconds, outcome, usage) notified after every call
+        self.observers = []
+
+    def _headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def build_payload(self, messages, **params):
+        """Build the JSON body for a chat completion request"""
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        data.update(params)
+        return data
+
+    def _backoff(self, attempt):
+        # Full jitter: sleep a random amount up to the exponential ceiling
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        time.sleep(random.uniform(0, ceiling))
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._counters[key] += amount
+
+    def post(self, payload, stream=False):
+        """POST a payload with retries and circuit breaking; returns the response"""
+        self._count('calls')
+        if not self.breaker.allow():
+            self._count('rejected')
+            raise CircuitOpenError('LLM provider is unavailable (circuit open)')
+
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count('retries')
+                self._backoff(attempt - 1)
+            self._count('attempts')
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.base_url, headers=self._headers(), json=payload,
+                                             timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                last_error = e
+                continue
+
+            if response.status_code in self.RETRY_STATUSES:
+                last_error = LLMError(f'{response.status_code} error from LLM provider')
+                response.close()
+                continue
+
+            if not stream:
+                self._record_latency(time.perf_counter() - started)
+            if response.status_code >= 400:
+                # Client errors are our fault, not the provider's: don't trip the breaker
+                self.breaker.record_success()
+                try:
+                    response.raise_for_status()
+                except requests.HTTPError as e:
+                    raise LLMError(str(e)) from e
+                finally:
+                    # Nobody reads a streamed error body; release its pooled connection now
+                    response.close()
+            self.breaker.record_success()
+            return response
+
+        self._count('failures')
+        self.breaker.record_failure()
+        raise LLMError(f'LLM request failed after {self.max_retries + 1} attempts: {last_error}') from last_error
+
+    def _notify(self, mode, started, outcome, usage=None):
+        elapsed = time.perf_counter() - started
+        for observer in self.observers:
+            observer(mode, elapsed, outcome, usage)
+
+    def chat(self, messages, **params):
+        """Send a chat completion request and return the decoded JSON body"""
+        started = time.perf_counter()
+        try:
+            response = self.post(self.build_payload(messages, **params))
+            body = response.json()
+        except ValueError as e:
+            self._notify('complete', started, 'error')
+            raise LLMError('Invalid JSON from LLM provider') from e
+        except CircuitOpenError:
+            self._notify('complete', started, 'rejected')
+            raise
+        except Exception:
+            self._notify('complete', started, 'error')
+            raise
+        self._notify('complete', started, 'ok', body.get('usage') if isinstance(body, dict) else None)
+        return body
+
+    @staticmethod
+    def build_messages(prompt, system_message, history=None):
+        """Messages for a prompt: system message, optional earlier turns, then the prompt"""
+        return [
+            {"role": "system", "content": system_message},
+            *(history or []),
+            {"role": "user", "content": prompt}
+        ]
+
+    def complete(self, prompt, system_message, history=None):
+        """Return the assistant message for a system + user prompt"""
+        body = self.chat(self.build_messages(prompt, system_message, history))
+        try:
+            return body['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError) as e:
+            raise LLMError('Unexpected response format from LLM provider') from e
+
+    def stream_chat(self, messages, **params):
+        """Yield content deltas from a streaming chat completion"""
+        started = time.perf_counter()
+        try:
+            response = self.post(self.build_payload(messages, stream=True, **params), stream=True)
+        except CircuitOpenError:
+            self._notify('stream', started, 'rejected')
+            raise
+        except Exception:
+            self._notify('stream', started, 'error')
+            raise
+        # SSE is always UTF-8; requests would otherwise assume ISO-8859-1 for text/*
+        response.encoding = 'utf-8'
+        outcome = 'error'
+        usage = None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events; lines starting with ':' are keep-alive comments
+                if not line or line.startswith(':') or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(data)
+                except ValueError as e:
+                    raise LLMError('Invalid stream chunk from LLM provider') from e
+                if 'error' in chunk:
+                    raise LLMError(f"LLM provider error: {chunk['error']}")
+                usage = chunk.get('usage') or usage
+                choices = chunk.get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    yield content
+            outcome = 'ok'
+        except requests.RequestException as e:
+            raise LLMError(f'LLM stream interrupted: {e}') from e
+        finally:
+            response.close()
+            self._record_latency(time.perf_counter() - started)
+            self._notify('stream', started, outcome, usage)
+
+    def _record_latency(self, seconds):
+        with self._stats_lock:
+            self._latencies.append(seconds)
+
+    def stats(self):
+        """Return connection pool, latency and error statistics"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        pools = []
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                'host': pool.host,
+                'connections_created': pool.num_connections,
+                'requests': pool.num_requests,
+                'free_slots': pool.pool.qsize() if pool.pool is not None else 0,
+                'max_size': self.pool_size,
+            })
+
+        return {
+            **counters,
+            'circuit_state': self.breaker.state,
+            'latency_samples': len(latencies),
+            'latency_avg': sum(latencies) / len(latencies) if latencies else None,
+            'latency_p50': percentile(0.50),
+            'latency_p95': percentile(0.95),
+            'latency_p99': percentile(0.99),
+            'pools': pools,
+        }
+
+    def close(self):
+        self.session.close()
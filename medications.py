@@ -0,0 +1,68 @@
+"""Normalization of free-text medication lists"""
+import re
+from itertools import combinations
+
+# Entries are separated by newlines, commas, semicolons, '+', '&', '/' or the word 'and'
+_SEPARATORS = re.compile(r'[\n,;+&/]|\band\b', re.IGNORECASE)
+_BULLET = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s*')
+_APOSTROPHES = re.compile(r"['\u2019]")
+_PUNCTUATION = re.compile(r'[^\w\s%-]')
+# A dose or count: '81mg', '500', '1-2', '0.5%' (the '.' is already a space), '2x'
+_DOSE = re.compile(r'^\d+(?:-\d+)?(?:mg|mcg|ug|g|ml|l|iu|u|units?|meq|x|%)?$')
+
+# Words of the dosage/frequency/form/instruction part of an entry
+_STOP_WORDS = frozenset({
+    'daily', 'once', 'twice', 'thrice', 'weekly', 'nightly', 'every', 'each', 'per',
+    'morning', 'evening', 'bedtime', 'as', 'prn', 'qd', 'bid', 'tid', 'qid', 'qhs',
+    'tablet', 'tablets', 'tab', 'tabs', 'capsule', 'capsules', 'cap', 'caps',
+    'pill', 'pills', 'mg', 'mcg', 'g', 'kg', 'ml', 'iu', 'units', 'drops', 'patch', 'injection',
+    'take', 'taken', 'with', 'without', 'food', 'meal', 'meals', 'before', 'after', 'at',
+    'night', 'by', 'mouth', 'orally', 'times', 'day', 'days', 'week', 'hour', 'hours', 'needed',
+})
+
+
+def split_medication(entry):
+    """Split one entry into drug names and words that couldn't be placed
+
+    'Aspirin 81mg daily' gives (['aspirin'], []). A dose or stop word ends a
+    name but not the entry. Words after it are another drug when a dose
+    follows them ('aspirin 81mg warfarin 5mg'); otherwise they are returned as
+    leftovers ('aspirin 81mg warfarin'), since they may still be a drug.
+    """
+    entry = _BULLET.sub('', entry)
+    entry = _PUNCTUATION.sub(' ', _APOSTROPHES.sub('', entry.lower()))
+    names, leftovers, words = [], [], []
+    starts_entry = True
+    for word in entry.split() + ['']:
+        # Only whole dose tokens end a name, so '5-fluorouracil' and 'd3' are kept
+        if word and not _DOSE.match(word) and word not in _STOP_WORDS:
+            words.append(word)
+            continue
+        if words:
+            if starts_entry or _DOSE.match(word):
+                names.append(' '.join(words))
+            else:
+                leftovers.append(' '.join(words))
+            words = []
+        starts_entry = False
+    return names, leftovers
+
+
+def parse_medications(text):
+    """Tokenize a free-text list into sorted, de-duplicated drug names and leftover words"""
+    names, leftovers = set(), set()
+    for entry in _SEPARATORS.split(text):
+        entry_names, entry_leftovers = split_medication(entry)
+        names.update(entry_names)
+        leftovers.update(entry_leftovers)
+    return sorted(names), sorted(leftovers)
+
+
+def normalize_medications(text):
+    """Sorted, de-duplicated drug names in a free-text list"""
+    return parse_medications(text)[0]
+
+
+def medication_pairs(names):
+    """Return every unordered pair of drug names, each pair sorted"""
+    return list(combinations(sorted(names), 2))
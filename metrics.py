@@ -0,0 +1,297 @@
+"""Request-level performance instrumentation in Prometheus text format
+
+Metrics are kept in each process. On their own, a scrape only sees the
+worker that answered it, so with several gunicorn workers give the
+Registry a shared ``directory`` (METRICS_DIR): every process then writes
+snapshots there and /metrics reports the sum over all of them.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+from flask import Response, g, has_request_context, request
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return (self.name, 'counter', self.help,
+                [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items])
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        samples = []
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((f'{self.name}_sum', labels, total))
+            samples.append((f'{self.name}_count', labels, count))
+        return (self.name, 'histogram', self.help, samples)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors, and renders them as text.
+
+    With a ``directory``, each process writes its samples to its own file
+    there every ``flush_interval`` seconds (once ``start`` is called) and at
+    exit, and ``render`` merges every file. Counters and histograms are summed
+    over all files, including those of workers that have exited, so totals
+    never go backwards when a worker is replaced. Gauges are summed over
+    processes that are still running. Clear the directory when the server
+    starts, as gunicorn.conf.py does.
+    """
+
+    def __init__(self, directory=None, flush_interval=5):
+        self._metrics = []
+        self._collectors = []
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._path = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn() -> [(name, type, help, [(labels_dict, value), ...]), ...] called on every scrape"""
+        self._collectors.append(fn)
+        return fn
+
+    def collect(self):
+        """This process's metric families as [(name, type, help, [(sample_name, labels, value), ...]), ...]"""
+        families = [metric.collect() for metric in self._metrics]
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                families.append((name, kind, help, [(name, labels, value) for labels, value in samples]))
+        return families
+
+    def start(self):
+        """Begin writing snapshots to the shared directory (call in each worker, not the master)"""
+        if not self.directory or self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        atexit.register(self.flush)
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def flush(self):
+        """Write this process's current samples to its file in the shared directory"""
+        if not self._path:
+            return
+        temp = f'{self._path}.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'pid': os.getpid(), 'families': self.collect()}, f)
+        os.replace(temp, self._path)
+
+    def _merged(self):
+        self.start()
+        self.flush()
+        families = {}
+        totals = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue  # removed or being replaced
+            alive = _pid_alive(snapshot['pid'])
+            for name, kind, help, samples in snapshot['families']:
+                families.setdefault(name, (kind, help))
+                series = totals.setdefault(name, {})
+                if kind == 'gauge' and not alive:
+                    continue
+                for sample_name, labels, value in samples:
+                    key = (sample_name, tuple(labels.items()))
+                    series[key] = series.get(key, 0) + value
+        return [(name, kind, help, [(sample_name, dict(labels), value) for (sample_name, labels), value in totals[name].items()])
+                for name, (kind, help) in families.items()]
+
+    def render(self):
+        lines = []
+        for name, kind, help, samples in (self._merged() if self.directory else self.collect()):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample_name, labels, value in samples:
+                lines.append(f'{sample_name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """Standard metrics for the app: HTTP, SQL, templates and LLM calls"""
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.http_duration = r.histogram('http_request_duration_seconds', 'HTTP request latency', ('method', 'route', 'status'))
+        self.db_duration = r.histogram('db_query_duration_seconds', 'SQL statement latency', ('operation',), DB_BUCKETS)
+        self.db_queries_per_request = r.histogram('db_queries_per_request', 'SQL statements per HTTP request', ('route',),
+                                                  (0, 1, 2, 3, 5, 10, 20, 50, 100))
+        self.template_duration = r.histogram('template_render_duration_seconds', 'Template render time', ('template',))
+        self.llm_duration = r.histogram('llm_request_duration_seconds', 'LLM call latency', ('mode', 'outcome'))
+        self.llm_calls = r.counter('llm_requests_total', 'LLM calls by outcome', ('mode', 'outcome'))
+        self.llm_tokens = r.counter('llm_tokens_total', 'Tokens reported by the LLM provider', ('kind',))
+
+    def observe_llm(self, mode, seconds, outcome, usage=None):
+        """LLMClient observer: record one call"""
+        self.llm_duration.observe(seconds, mode=mode, outcome=outcome)
+        self.llm_calls.inc(mode=mode, outcome=outcome)
+        for kind in ('prompt_tokens', 'completion_tokens'):
+            if usage and usage.get(kind):
+                self.llm_tokens.inc(usage[kind], kind=kind.split('_')[0])
+        if has_request_context():
+            g.metrics_llm_time = g.get('metrics_llm_time', 0.0) + seconds
+
+    def init_app(self, app, engine, server_timing=False):
+        """Hook request, SQL and template timing into a Flask app"""
+
+        @app.before_request
+        def start_timer():
+            self.registry.start()
+            g.metrics_start = time.perf_counter()
+            g.metrics_db_time = 0.0
+            g.metrics_db_queries = 0
+            g.metrics_template_time = 0.0
+
+        @app.after_request
+        def record_request(response):
+            started = g.get('metrics_start')
+            if started is None:
+                return response
+            elapsed = time.perf_counter() - started
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            self.http_duration.observe(elapsed, method=request.method, route=route, status=str(response.status_code))
+            self.db_queries_per_request.observe(g.metrics_db_queries, route=route)
+            if server_timing:
+                # Streaming responses report time to first byte as 'app'
+                response.headers['Server-Timing'] = ', '.join([
+                    f'app;dur={elapsed * 1000:.1f}',
+                    f'db;dur={g.metrics_db_time * 1000:.1f};desc="{g.metrics_db_queries} queries"',
+                    f'tpl;dur={g.metrics_template_time * 1000:.1f}',
+                    f"llm;dur={g.get('metrics_llm_time', 0.0) * 1000:.1f}",
+                ])
+            return response
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+            self.db_duration.observe(elapsed, operation=operation)
+            if has_request_context() and 'metrics_db_time' in g:
+                g.metrics_db_time += elapsed
+                g.metrics_db_queries += 1
+
+        def template_started(sender, template, context, **extra):
+            if has_request_context():
+                g.metrics_template_started = time.perf_counter()
+
+        def template_finished(sender, template, context, **extra):
+            if not has_request_context() or 'metrics_template_started' not in g:
+                return
+            elapsed = time.perf_counter() - g.pop('metrics_template_started')
+            self.template_duration.observe(elapsed, template=template.name or 'string')
+            g.metrics_template_time = g.get('metrics_template_time', 0.0) + elapsed
+
+        # Signals hold weak references by default, which would drop these closures
+        before_render_template.connect(template_started, app, weak=False)
+        template_rendered.connect(template_finished, app, weak=False)
+
+    def response(self):
+        """The /metrics response body in Prometheus text exposition format"""
+        return Response(self.registry.render(), mimetype='text/plain; version=0.0.4')
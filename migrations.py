@@ -0,0 +1,91 @@
+"""In-place schema upgrades for databases created by earlier versions of the app"""
+import json
+
+from sqlalchemy import Integer, SmallInteger, inspect, text
+
+
+def table_columns(engine, table_name):
+    return {column['name'] for column in inspect(engine).get_columns(table_name)}
+
+
+def add_column(engine, table_name, column_name, column_type, constraints=''):
+    """ALTER TABLE ... ADD COLUMN unless a column of that name already exists
+
+    ``column_type`` is a SQLAlchemy type instance, compiled for the engine's
+    dialect (``DateTime()`` is DATETIME on SQLite, TIMESTAMP on PostgreSQL),
+    and names are quoted, so reserved words such as ``user`` work everywhere.
+    """
+    if column_name in table_columns(engine, table_name):
+        return False
+    preparer = engine.dialect.identifier_preparer
+    ddl = (f'ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(column_name)} '
+           f'{column_type.compile(dialect=engine.dialect)} {constraints}')
+    with engine.begin() as conn:
+        conn.execute(text(ddl.rstrip()))
+    return True
+
+
+def upgrade_answer_masks(engine, table_name, questionnaire, chunk_size=5000, progress=None):
+    """Replace a table's JSON ``answers`` column with ``answer_mask`` and ``schema_version``.
+
+    The new columns are added, every row's answers are encoded into a mask
+    in primary-key chunks (one transaction each), and the JSON column is
+    dropped. Safe to run on every start: a table without ``answers`` is
+    already upgraded and is left alone, and an interrupted run simply
+    converts everything again. Returns the number of rows converted.
+    """
+    if 'answers' not in table_columns(engine, table_name):
+        return 0
+
+    add_column(engine, table_name, 'answer_mask', Integer(), 'NOT NULL DEFAULT 0')
+    add_column(engine, table_name, 'schema_version', SmallInteger(), f'NOT NULL DEFAULT {questionnaire.version}')
+
+    table = engine.dialect.identifier_preparer.quote(table_name)
+    read = text(f'SELECT id, answers FROM {table} WHERE id > :last_id ORDER BY id LIMIT :limit')
+    write = text(f'UPDATE {table} SET answer_mask = :mask, schema_version = :version WHERE id = :row_id')
+    converted = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(read, {'last_id': last_id, 'limit': chunk_size}).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, answers in rows:
+                try:
+                    answers = json.loads(answers) if answers else {}
+                except ValueError:
+                    answers = {}
+                updates.append({'row_id': row_id, 'mask': questionnaire.encode_mask(answers), 'version': questionnaire.version})
+            conn.execute(write, updates)
+        last_id = rows[-1][0]
+        converted += len(rows)
+        if progress:
+            progress(table_name, converted)
+
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table} DROP COLUMN answers'))
+    return converted
+
+
+def widen_column(engine, table_name, column_name, length):
+    """Raise a VARCHAR column's length limit; SQLite doesn't enforce lengths, so it is skipped there"""
+    if not column_too_narrow(engine, table_name, column_name, length):
+        return False
+    dialect = engine.dialect.name
+    table = engine.dialect.identifier_preparer.quote(table_name)
+    if dialect == 'mysql':
+        ddl = f'ALTER TABLE {table} MODIFY {column_name} VARCHAR({length}) NOT NULL'
+    else:
+        ddl = f'ALTER TABLE {table} ALTER COLUMN {column_name} TYPE VARCHAR({length})'
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
+    return True
+
+
+def column_too_narrow(engine, table_name, column_name, length):
+    """Whether a VARCHAR column enforces a limit below ``length`` (never on SQLite)"""
+    if engine.dialect.name == 'sqlite':
+        return False
+    column = next(c for c in inspect(engine).get_columns(table_name) if c['name'] == column_name)
+    return (getattr(column['type'], 'length', None) or length) < length
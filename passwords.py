@@ -0,0 +1,89 @@
+"""Password hashing with a configurable method, run off the request thread"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingUnavailable(Exception):
+    """The hashing pool didn't answer in time or lost a worker process"""
+
+
+class PasswordHasher:
+    """Hash and verify passwords with Werkzeug, optionally in worker processes.
+
+    ``method`` is any Werkzeug method string with its cost, e.g.
+    ``pbkdf2:sha256:600000`` or ``scrypt:32768:8:1``. Hashes record the
+    method they were made with, so old hashes keep verifying after it
+    changes and ``needs_rehash`` tells when one should be replaced.
+
+    With ``workers`` > 0 the hashing runs in a pool of that many processes,
+    so a burst of logins uses those cores instead of stalling the request
+    workers (a gevent worker can't serve anything else while a greenlet
+    hashes). The pool is started on first use, so pre-forking servers don't
+    create it in the master. A call that times out or finds the pool broken
+    raises ``HashingUnavailable``; a broken pool is replaced on the next call.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:600000', workers=0, timeout=30):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._method_id = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: fresh interpreters that don't inherit the parent's gevent hub or threads
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool as e:
+            # A worker process died; start a fresh pool instead of failing every later call
+            self._discard(executor)
+            raise HashingUnavailable('password hashing process exited') from e
+        except FutureTimeoutError as e:
+            future.cancel()
+            raise HashingUnavailable(f'password hashing took longer than {self.timeout}s') from e
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    @property
+    def method_id(self):
+        """The configured method with Werkzeug's defaults filled in, as stored in hashes"""
+        if self._method_id is None:
+            self._method_id = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._method_id
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method_id
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
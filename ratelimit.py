@@ -0,0 +1,223 @@
+"""Rate limiting for AI-backed routes: per-user token buckets and a fair global concurrency cap"""
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import jsonify
+
+from sqlite_pool import SQLitePool
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_RATE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+def parse_rate(text):
+    """Parse '20/minute' or '100/5 minutes' into (requests, seconds); '' or '0' disables the limit"""
+    if not text or text.strip() == '0':
+        return None
+    match = _RATE.match(text.lower())
+    if not match:
+        raise ValueError(f'Invalid rate limit {text!r}; expected e.g. "20/minute"')
+    count, multiplier, period = match.groups()
+    return int(count), int(multiplier or 1) * _PERIODS[period]
+
+
+class MemoryBucketStore:
+    """Token buckets held in this process"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_second, cost=1):
+        """Take ``cost`` tokens; returns (allowed, seconds until enough tokens are available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / refill_per_second
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker process on the host.
+
+    Each ``take`` is one short write transaction, so the buckets stay exact
+    across processes. Buckets idle for longer than ``max_idle`` seconds are
+    full again and are deleted every few hundred calls.
+    """
+
+    PRUNE_EVERY = 500
+
+    def __init__(self, path, max_idle=86400, pool_size=8):
+        self.path = path
+        self.max_idle = max_idle
+        self._pool = SQLitePool(path, size=pool_size, pragmas=('journal_mode=WAL', 'synchronous=NORMAL'))
+        self._calls = 0
+        self._pool.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets ('
+            'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def take(self, key, capacity, refill_per_second, cost=1):
+        """Take ``cost`` tokens; returns (allowed, seconds until enough tokens are available)"""
+        now = time.time()
+        with self._pool.connection() as conn:
+            # IMMEDIATE takes the write lock up front so two workers can't both spend the same tokens
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                'INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - self.max_idle,))
+        return allowed, 0.0 if allowed else (cost - tokens) / refill_per_second
+
+    def clear(self):
+        self._pool.execute('DELETE FROM rate_limit_buckets')
+
+
+class RateLimiter:
+    """Route decorator that applies a token bucket per (limit name, user).
+
+    A limit of N/period allows bursts of up to N requests and refills at
+    N per period. Rejected requests get ``on_limit(retry_after)`` if given,
+    otherwise a 429 JSON response; both carry a Retry-After header.
+    """
+
+    def __init__(self, store, identity):
+        self.store = store
+        self.identity = identity
+        self.rejected = {}
+        self._lock = threading.Lock()
+
+    def check(self, name, rate, cost=1):
+        """Spend from the current user's bucket for ``name``; returns (allowed, retry_after)"""
+        if rate is None:
+            return True, 0.0
+        count, seconds = rate
+        allowed, retry_after = self.store.take(f'{name}:{self.identity()}', count, count / seconds, cost)
+        if not allowed:
+            with self._lock:
+                self.rejected[name] = self.rejected.get(name, 0) + 1
+        return allowed, retry_after
+
+    def limit(self, name, rate, on_limit=None):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                allowed, retry_after = self.check(name, rate)
+                if allowed:
+                    return view(*args, **kwargs)
+                if on_limit is not None:
+                    response = on_limit(retry_after)
+                else:
+                    response = jsonify({'error': 'Too many requests, please wait a moment and try again.'}), 429
+                if isinstance(response, tuple):
+                    response = (response[0], response[1], {'Retry-After': str(int(retry_after) + 1)})
+                return response
+            return wrapper
+        return decorator
+
+
+class CapacityError(Exception):
+    """No LLM slot became free before the caller's deadline"""
+
+
+class FairScheduler:
+    """Caps concurrent work and hands free slots to waiting owners round-robin.
+
+    Waiters are queued per owner (a user id, or a label for background work),
+    and each free slot goes to the next owner in turn. A user with many
+    requests queued only gets every Nth slot while N owners are waiting, so
+    they can't starve everyone else. ``max_waiting`` bounds the queue and
+    ``timeout`` bounds how long a caller waits; both raise CapacityError.
+    """
+
+    def __init__(self, max_concurrent, max_waiting=1000, timeout=30):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._queues = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, owner):
+        """Hold one slot for the duration of the block"""
+        self.acquire(owner)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, owner):
+        with self._lock:
+            if self.active < self.max_concurrent and not self._queues:
+                self.active += 1
+                return
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise CapacityError('Too many AI requests queued')
+            ticket = threading.Event()
+            self._queues.setdefault(owner, deque()).append(ticket)
+            self.waiting += 1
+
+        if ticket.wait(self.timeout):
+            return
+        with self._lock:
+            if ticket.is_set():
+                # Granted between the timeout and taking the lock
+                return
+            queue = self._queues.get(owner)
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[owner]
+            self.waiting -= 1
+            self.rejected += 1
+        raise CapacityError('Timed out waiting for an AI request slot')
+
+    def release(self):
+        with self._lock:
+            if not self._queues:
+                self.active -= 1
+                return
+            # Hand the slot straight to the next owner in turn; active stays the same
+            owner, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            del self._queues[owner]
+            if queue:
+                self._queues[owner] = queue
+            self.waiting -= 1
+            ticket.set()
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'waiting': self.waiting, 'owners_waiting': len(self._queues),
+                    'rejected': self.rejected, 'max_concurrent': self.max_concurrent}
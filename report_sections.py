@@ -0,0 +1,73 @@
+"""Precomputed heart and stroke report sections, assembled into instant reports"""
+import threading
+import time
+
+RISK_LEVELS = ('Low', 'Moderate', 'High')
+
+DISCLAIMER = ("Important: This report is for educational purposes only and does not replace professional "
+              "medical advice. Please discuss your results with a healthcare professional.")
+
+
+class ReportLibrary:
+    """In-memory copy of the precomputed report sections.
+
+    A report for any answer set is the section for its risk level followed
+    by one section per factor answered "yes", so a questionnaire with F
+    factors needs only F + 3 stored sections to cover every combination.
+    ``loader()`` returns (questionnaire, section, key, content) rows, where
+    section is 'level' or 'factor'. It is called on first use and again
+    once the copy is ``ttl`` seconds old, so sections precomputed by
+    another process are picked up without a restart.
+    """
+
+    def __init__(self, questionnaires, loader, ttl=300):
+        self.questionnaires = questionnaires
+        self.loader = loader
+        self.ttl = ttl
+        self._sections = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def required(self, name):
+        """(section, key) pairs a questionnaire needs for complete coverage"""
+        return [('level', level) for level in RISK_LEVELS] + \
+               [('factor', key) for key in self.questionnaires[name].keys]
+
+    def _get_sections(self):
+        if self._sections is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.reload()
+        return self._sections
+
+    def reload(self):
+        sections = {(q, section, key): content for q, section, key, content in self.loader()}
+        with self._lock:
+            self._sections = sections
+            self._loaded_at = time.monotonic()
+
+    def missing(self, name):
+        sections = self._get_sections()
+        return [(section, key) for section, key in self.required(name) if (name, section, key) not in sections]
+
+    def assemble(self, name, score, risk_level, answers):
+        """Build a report from stored sections, or return None if any needed section is missing"""
+        sections = self._get_sections()
+        questionnaire = self.questionnaires[name]
+        level_text = sections.get((name, 'level', risk_level))
+        if level_text is None:
+            return None
+
+        # Heaviest factors first, as they contribute most to the score
+        factors = sorted(
+            (i for i, key in enumerate(questionnaire.keys) if answers.get(key) == 'yes'),
+            key=lambda i: -int(questionnaire.weights[i])
+        )
+        parts = [f"{name.title()} risk score: {score}/100 ({risk_level} risk)", level_text.strip(), "YOUR RISK FACTORS"]
+        if not factors:
+            parts.append("You did not report any of the risk factors in this assessment.")
+        for i in factors:
+            text = sections.get((name, 'factor', questionnaire.keys[i]))
+            if text is None:
+                return None
+            parts.append(f"{questionnaire.questions[i]} Yes\n{text.strip()}")
+        parts.append(DISCLAIMER)
+        return "\n\n".join(parts)
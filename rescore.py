@@ -0,0 +1,75 @@
+"""Bulk re-scoring of stored assessments after the factor weights change"""
+import time
+
+import numpy as np
+from sqlalchemy import bindparam, func, select, update
+
+from scoring import risk_levels
+
+
+def rescore_table(session, model, questionnaire, chunk_size=5000, dry_run=False, progress=None):
+    """Recompute score and risk_level for every row of an assessment table.
+
+    Rows are read in primary-key order one chunk at a time (keyset
+    pagination, so each chunk is a cheap index range scan and memory stays
+    flat at any table size). Each chunk's answer masks are expanded and
+    scored as one matrix, with no per-row decoding. Masks stored under an
+    older questionnaire version are re-mapped to the current one and saved
+    with it. Only rows whose score, risk level or mask changed are written
+    back, with one executemany UPDATE and one commit per chunk.
+
+    Returns a dict with the number of rows processed and updated, and the
+    elapsed time. ``progress`` is called with the same dict after each chunk.
+    """
+    table = model.__table__
+    total = session.execute(select(func.count()).select_from(table)).scalar()
+    write = (
+        update(table)
+        .where(table.c.id == bindparam('row_id'))
+        .values(score=bindparam('new_score'), risk_level=bindparam('new_risk_level'),
+                answer_mask=bindparam('new_mask'), schema_version=bindparam('new_version'))
+    )
+    query = (
+        select(table.c.id, table.c.answer_mask, table.c.schema_version, table.c.score, table.c.risk_level)
+        .order_by(table.c.id)
+        .limit(chunk_size)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    stats = {'table': table.name, 'total': total, 'processed': 0, 'updated': 0, 'elapsed': 0.0, 'rows_per_second': 0.0}
+    started = time.perf_counter()
+    last_id = 0
+
+    while True:
+        rows = session.execute(query.where(table.c.id > last_id)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        masks = np.array([row.answer_mask for row in rows], dtype=np.int64)
+        versions = np.array([row.schema_version for row in rows])
+        for version in set(versions.tolist()) - {questionnaire.version}:
+            old = versions == version
+            masks[old] = questionnaire.upgrade_masks(masks[old], version)
+        scores = questionnaire.score_masks(masks)
+        levels = risk_levels(scores)
+
+        changes = [
+            {'row_id': row.id, 'new_score': int(score), 'new_risk_level': str(level),
+             'new_mask': int(mask), 'new_version': questionnaire.version}
+            for row, score, level, mask in zip(rows, scores, levels, masks)
+            if row.score != score or row.risk_level != level or row.schema_version != questionnaire.version
+        ]
+        if changes and not dry_run:
+            session.execute(write, changes)
+        session.commit()
+
+        stats['processed'] += len(rows)
+        stats['updated'] += len(changes)
+        stats['elapsed'] = time.perf_counter() - started
+        stats['rows_per_second'] = stats['processed'] / stats['elapsed'] if stats['elapsed'] else 0.0
+        if progress:
+            progress(dict(stats))
+
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
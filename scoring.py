@@ -0,0 +1,283 @@
+"""Risk questionnaires and vectorized scoring
+
+Each questionnaire is compiled once into a weight vector, so any number of
+answer sets can be scored with a single matrix-vector product:
+
+    matrix = HEART.encode_many(list_of_answer_dicts)   # (n, factors) of 0/1
+    scores = HEART.score_batch(matrix)                 # (n,) ints, capped at 100
+
+Stored assessments keep their answers as an integer bitmask (bit i set when
+factor i is "yes") tagged with the questionnaire's schema version:
+
+    mask = HEART.encode_mask(answers)                  # e.g. 0b10000000001
+    scores = HEART.score_masks(array_of_masks)         # no per-row decoding
+
+Batch CLI (CSV in/out, or Parquet when pyarrow is installed):
+
+    python scoring.py heart assessments.csv -o scored.csv
+"""
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+MAX_SCORE = 100
+TRUE_VALUES = frozenset({'yes', 'y', '1', 'true', 't'})
+FALSE_VALUES = frozenset({'no', 'n', '0', 'false', 'f'})
+
+
+class Questionnaire:
+    """An ordered set of yes/no risk factors with integer weights
+
+    ``version`` identifies the factor order used for answer masks. When
+    factors are added, removed or reordered, bump it and list the old key
+    order in ``previous_keys`` so masks stored under it can still be read.
+    """
+
+    def __init__(self, name, factors, cap=MAX_SCORE, version=1, previous_keys=None):
+        self.name = name
+        self.keys = tuple(key for key, _, _ in factors)
+        self.questions = tuple(question for _, question, _ in factors)
+        self.weights = np.array([weight for _, _, weight in factors], dtype=np.int32)
+        self.cap = cap
+        self._weight_list = [int(w) for w in self.weights]
+        self.version = version
+        self.schemas = {**(previous_keys or {}), version: self.keys}
+        if len(self.keys) > 31:
+            raise ValueError(f'{name} has {len(self.keys)} factors; answer masks hold at most 31')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def normalize(self, answers):
+        """Reduce a form submission to a yes/no answer per factor, in factor order"""
+        return {key: 'yes' if answers.get(key) == 'yes' else 'no' for key in self.keys}
+
+    def score(self, answers):
+        """Score one answer dict (plain Python; cheaper than NumPy for a single row)"""
+        total = sum(weight for key, weight in zip(self.keys, self._weight_list) if answers.get(key) == 'yes')
+        return min(total, self.cap)
+
+    def encode(self, answers):
+        """Encode one answer dict as a 0/1 row vector"""
+        return np.array([answers.get(key) == 'yes' for key in self.keys], dtype=np.uint8)
+
+    def encode_many(self, answer_dicts):
+        """Encode a sequence of answer dicts as an (n, factors) 0/1 matrix"""
+        matrix = np.zeros((len(answer_dicts), len(self.keys)), dtype=np.uint8)
+        for row, answers in enumerate(answer_dicts):
+            for col, key in enumerate(self.keys):
+                if answers.get(key) == 'yes':
+                    matrix[row, col] = 1
+        return matrix
+
+    def encode_mask(self, answers):
+        """Encode one answer dict as an int with bit i set when factor i is 'yes'"""
+        return sum(1 << i for i, key in enumerate(self.keys) if answers.get(key) == 'yes')
+
+    def decode_mask(self, mask, version=None):
+        """Normalized answer dict (every current factor, 'yes' or 'no') for a stored mask"""
+        yes = self.mask_keys(mask, version)
+        return {key: 'yes' if key in yes else 'no' for key in self.keys}
+
+    def mask_keys(self, mask, version=None):
+        """Keys of the factors set in a mask, in factor order"""
+        keys = self.schemas[version or self.version]
+        return [key for i, key in enumerate(keys) if mask >> i & 1]
+
+    def upgrade_masks(self, masks, version):
+        """Re-map masks written under an older schema version to the current bit layout"""
+        masks = np.asarray(masks, dtype=np.int64)
+        if version == self.version:
+            return masks
+        upgraded = np.zeros_like(masks)
+        for old_bit, key in enumerate(self.schemas[version]):
+            if key in self.keys:
+                upgraded |= ((masks >> old_bit) & 1) << self.keys.index(key)
+        return upgraded
+
+    def masks_to_matrix(self, masks):
+        """Expand an array of masks into an (n, factors) 0/1 matrix"""
+        masks = np.asarray(masks, dtype=np.int64)
+        return ((masks[:, None] >> np.arange(len(self.keys))) & 1).astype(np.uint8)
+
+    def matrix_to_masks(self, matrix):
+        """Collapse an (n, factors) 0/1 matrix into an array of current-version masks"""
+        return np.asarray(matrix, dtype=np.int64) @ (np.int64(1) << np.arange(len(self.keys), dtype=np.int64))
+
+    def score_masks(self, masks):
+        """Score an array of current-version masks; returns an int array"""
+        return self.score_batch(self.masks_to_matrix(masks))
+
+    def score_batch(self, matrix):
+        """Score an (n, factors) 0/1 matrix; returns an int array of length n"""
+        matrix = np.asarray(matrix)
+        if matrix.ndim != 2 or matrix.shape[1] != len(self.keys):
+            raise ValueError(f'{self.name} answers must have shape (n, {len(self.keys)}), got {matrix.shape}')
+        return np.minimum(matrix.astype(np.int32) @ self.weights, self.cap)
+
+
+def risk_level(score):
+    """Map a score to its risk level"""
+    return "Low" if score < 30 else "Moderate" if score < 60 else "High"
+
+
+def risk_levels(scores):
+    """Vectorized risk_level for an array of scores"""
+    scores = np.asarray(scores)
+    return np.where(scores < 30, "Low", np.where(scores < 60, "Moderate", "High"))
+
+
+def parse_answer(value):
+    """True or False for a yes/no-like value (the spellings the batch CLI reads), None for anything else"""
+    text = str(value).strip().lower()
+    return True if text in TRUE_VALUES else False if text in FALSE_VALUES else None
+
+
+HEART = Questionnaire('heart', [
+    # Major symptoms
+    ("chest_pain", "Do you experience chest pain or discomfort?", 20),
+    ("shortness_breath", "Do you often feel shortness of breath (even at rest)?", 15),
+    ("fatigue", "Do you feel extreme fatigue or weakness often?", 10),
+    ("palpitations", "Do you have palpitations (fast or irregular heartbeat)?", 10),
+    ("dizziness", "Do you feel dizziness or lightheadedness frequently?", 10),
+    ("swelling", "Do you experience swelling in legs, ankles, or feet?", 10),
+    ("nausea", "Do you have nausea or cold sweats often?", 5),
+
+    # Medical conditions / risk factors
+    ("high_bp", "Do you have high blood pressure?", 10),
+    ("high_cholesterol", "Do you have high cholesterol?", 10),
+    ("diabetes", "Do you have diabetes?", 10),
+    ("smoking", "Do you smoke regularly?", 10),
+    ("alcohol", "Do you drink alcohol excessively?", 5),
+    ("obesity", "Do you have obesity or overweight issues?", 10),
+    ("sedentary", "Do you have a sedentary (inactive) lifestyle?", 5),
+
+    # Family / age factors
+    ("family_history", "Do you have a family history of heart disease?", 5),
+    ("age", "Are you above 55 years (men) or 65 years (women)?", 5),
+    ("stress", "Do you have high stress levels?", 5),
+])
+
+STROKE = Questionnaire('stroke', [
+    # Stroke warning signs (BE FAST model + others)
+    ("weakness_numbness", "Do you experience sudden weakness or numbness in face, arm, or leg (especially one side)?", 25),
+    ("speech_difficulty", "Do you have sudden difficulty speaking or understanding speech?", 20),
+    ("vision_problems", "Do you have sudden vision problems (one or both eyes)?", 10),
+    ("balance_issues", "Do you have sudden dizziness, loss of balance, or trouble walking?", 10),
+    ("severe_headache", "Do you have sudden severe headache with no known cause?", 10),
+
+    # Medical conditions / risk factors
+    ("high_bp", "Do you have high blood pressure?", 15),
+    ("diabetes", "Do you have diabetes?", 10),
+    ("high_cholesterol", "Do you have high cholesterol?", 10),
+    ("irregular_heartbeat", "Do you have atrial fibrillation or irregular heartbeat?", 10),
+    ("smoking", "Do you smoke regularly?", 10),
+    ("alcohol", "Do you drink alcohol excessively?", 5),
+    ("obesity", "Do you have obesity or overweight issues?", 10),
+    ("sedentary", "Do you have a sedentary (inactive) lifestyle?", 5),
+
+    # Family / age / stress
+    ("family_history", "Do you have a family history of stroke?", 5),
+    ("age", "Are you above 55 years of age?", 5),
+    ("stress", "Do you live under high stress?", 5),
+])
+
+QUESTIONNAIRES = {'heart': HEART, 'stroke': STROKE}
+
+
+# Batch CLI
+
+def _truthy_matrix(columns, n_rows):
+    """Build a 0/1 matrix from per-factor columns of yes/no-like values"""
+    matrix = np.zeros((n_rows, len(columns)), dtype=np.uint8)
+    for col, values in enumerate(columns):
+        if values is None:
+            continue
+        matrix[:, col] = [str(v).strip().lower() in TRUE_VALUES for v in values]
+    return matrix
+
+
+def score_csv(questionnaire, infile, outfile, chunk_size):
+    reader = csv.DictReader(infile)
+    fieldnames = list(reader.fieldnames or []) + ['score', 'risk_level']
+    writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+    writer.writeheader()
+    present = [key for key in questionnaire.keys if key in (reader.fieldnames or [])]
+
+    total = 0
+    while True:
+        rows = [row for _, row in zip(range(chunk_size), reader)]
+        if not rows:
+            break
+        columns = [[row[key] for row in rows] if key in present else None for key in questionnaire.keys]
+        scores = questionnaire.score_batch(_truthy_matrix(columns, len(rows)))
+        levels = risk_levels(scores)
+        for row, score, level in zip(rows, scores, levels):
+            row['score'] = int(score)
+            row['risk_level'] = level
+        writer.writerows(rows)
+        total += len(rows)
+    return total
+
+
+def score_parquet(questionnaire, in_path, out_path, chunk_size):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit('Parquet support requires pyarrow: pip install pyarrow')
+
+    source = pq.ParquetFile(in_path)
+    writer = None
+    total = 0
+    try:
+        for batch in source.iter_batches(batch_size=chunk_size):
+            names = batch.schema.names
+            columns = [batch.column(names.index(key)).to_pylist() if key in names else None
+                       for key in questionnaire.keys]
+            scores = questionnaire.score_batch(_truthy_matrix(columns, batch.num_rows))
+            table = pa.Table.from_batches([batch])
+            table = table.append_column('score', pa.array(scores, type=pa.int32()))
+            table = table.append_column('risk_level', pa.array(risk_levels(scores).tolist()))
+            if writer is None:
+                writer = pq.ParquetWriter(out_path, table.schema)
+            writer.write_table(table)
+            total += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score answer sets in bulk (CSV or Parquet)')
+    parser.add_argument('questionnaire', choices=sorted(QUESTIONNAIRES))
+    parser.add_argument('input', help="CSV or .parquet file with one column per factor ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="Output file ('-' for stdout)")
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows scored per batch')
+    args = parser.parse_args(argv)
+
+    questionnaire = QUESTIONNAIRES[args.questionnaire]
+
+    if args.input.endswith('.parquet'):
+        if args.output == '-':
+            parser.error('Parquet input needs an --output file')
+        total = score_parquet(questionnaire, args.input, args.output, args.chunk_size)
+    else:
+        infile = sys.stdin if args.input == '-' else open(args.input, newline='')
+        outfile = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+        try:
+            total = score_csv(questionnaire, infile, outfile, args.chunk_size)
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+            if outfile is not sys.stdout:
+                outfile.close()
+
+    print(f'Scored {total} rows', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
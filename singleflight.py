@@ -0,0 +1,138 @@
+"""Request coalescing: run one call per key at a time and share its result"""
+import os
+import threading
+import time
+import uuid
+
+from sqlite_pool import SQLitePool
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key within this process.
+
+    The first caller of ``do(key, fn)`` (the leader) runs ``fn``; callers
+    that arrive while it is running wait and receive the same result, or
+    the same exception. Nothing is remembered once the call finishes, which
+    is what the response cache is for. With a ``backend`` such as
+    LockTableFlight, the leader also coordinates with other processes.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'followers': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._counters['followers'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._counters['leaders'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self.backend.do(key, fn) if self.backend else fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._calls)
+        if self.backend:
+            stats.update(self.backend.stats())
+        return stats
+
+
+class LockTableFlight:
+    """Coalesce calls for the same key across processes with a SQLite lock table.
+
+    The process that inserts the key's row runs the call; the others poll
+    ``lookup(key)`` (normally a shared cache the leader writes its result
+    to) until a value appears. A lock expires after ``lease`` seconds, so a
+    crashed leader only holds others up that long. If the leader fails
+    without producing a value, the next poller takes the lock and runs the
+    call itself.
+    """
+
+    def __init__(self, path, lookup, lease=120, poll_interval=0.1, pool_size=8):
+        self.path = path
+        self.lookup = lookup
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._counters = {'remote_waits': 0, 'remote_hits': 0}
+        self._lock = threading.Lock()
+        self._pool = SQLitePool(path, size=pool_size)
+        self._pool.execute(
+            'CREATE TABLE IF NOT EXISTS llm_inflight ('
+            'key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def _try_lock(self, key):
+        now = time.time()
+        with self._pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM llm_inflight WHERE key = ? AND expires_at < ?', (key, now))
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO llm_inflight (key, owner, expires_at) VALUES (?, ?, ?)',
+                (key, self.owner, now + self.lease)
+            ).rowcount
+            conn.execute('COMMIT')
+        return inserted == 1
+
+    def _unlock(self, key):
+        self._pool.execute('DELETE FROM llm_inflight WHERE key = ? AND owner = ?', (key, self.owner))
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def do(self, key, fn):
+        waited = False
+        while True:
+            if self._try_lock(key):
+                try:
+                    # Another process may have finished between our last poll and taking the lock
+                    value = self.lookup(key) if waited else None
+                    return value if value is not None else fn()
+                finally:
+                    self._unlock(key)
+
+            if not waited:
+                waited = True
+                self._count('remote_waits')
+            time.sleep(self.poll_interval)
+            value = self.lookup(key)
+            if value is not None:
+                self._count('remote_hits')
+                return value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
@@ -0,0 +1,68 @@
+"""Bounded pool of SQLite connections for the side stores (cache, rate limits, single-flight)"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLitePool:
+    """Up to ``size`` connections to one SQLite file, reused across threads and greenlets.
+
+    A per-thread connection would mean one connection per request under
+    gevent, where every greenlet is its own "thread". Instead callers borrow
+    a connection for the duration of a ``with pool.connection()`` block and
+    wait when all ``size`` are in use. Connections run in autocommit mode;
+    a block that fails inside an explicit transaction is rolled back before
+    the connection goes back to the pool.
+    """
+
+    def __init__(self, path, size=8, timeout=5, pragmas=('journal_mode=WAL',)):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+        for pragma in self.pragmas:
+            conn.execute(f'PRAGMA {pragma}')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = None
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                self._created += 1
+        if conn is None:
+            try:
+                conn = self._open()
+            except BaseException:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def execute(self, sql, parameters=()):
+        """Run one statement on a pooled connection and return all rows"""
+        with self.connection() as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    def stats(self):
+        with self._cond:
+            return {'size': self.size, 'open': self._created, 'idle': len(self._idle)}
@@ -0,0 +1,70 @@
+"""ConversationStore: compaction together with syncing turns from other processes"""
+import chat_context
+from chat_context import ConversationStore
+
+
+class FakeChatTable:
+    """Stands in for the chat table shared by all processes"""
+
+    def __init__(self):
+        self.rows = []
+
+    def insert(self, message, response):
+        turn_id = len(self.rows) + 1
+        self.rows.append((turn_id, message, response))
+        return turn_id
+
+    def load(self, user_id, limit, after_id=0):
+        return [row for row in self.rows if row[0] > after_id][-limit:]
+
+
+def make_store(table, summaries, **kwargs):
+    def summarize(previous_summary, turns):
+        summaries.append([message for message, _ in turns])
+        return f'summary of {len(summaries)} batches'
+
+    # Two tokens per turn: the window holds five turns and the sixth overflowing turn triggers compaction
+    return ConversationStore(table.load, summarize, token_budget=12, compact_after=6, **kwargs)
+
+
+def chat(store, table, message):
+    store.context(1, 's', message)
+    response = message.replace('m', 'r')
+    store.append(1, message, response, turn_id=table.insert(message, response))
+
+
+def buffered_ids(store):
+    return [turn[0] for turn in store._conversations[1].turns]
+
+
+def test_sync_does_not_refetch_compacted_turns(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(chat_context.time, 'monotonic', lambda: clock[0])
+    table, summaries = FakeChatTable(), []
+    store = make_store(table, summaries, sync_interval=1000)
+
+    for i in range(1, 13):
+        chat(store, table, f'm{i}')
+    assert summaries == [[f'm{i}' for i in range(1, 7)]]
+    assert buffered_ids(store) == list(range(7, 13))
+
+    clock[0] += 1000
+    store.context(1, 's', 'm13')
+    assert buffered_ids(store) == list(range(7, 13))
+    assert len(summaries) == 1
+
+
+def test_sync_merges_other_processes_turns_in_order(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(chat_context.time, 'monotonic', lambda: clock[0])
+    table, summaries = FakeChatTable(), []
+    store = make_store(table, summaries, sync_interval=1000)
+
+    chat(store, table, 'm1')
+    other_id = table.insert('m2', 'r2')  # stored by another worker
+    chat(store, table, 'm3')
+
+    clock[0] += 1000
+    messages = store.context(1, 's', 'm4')
+    assert buffered_ids(store) == [1, other_id, 3]
+    assert [m['content'] for m in messages if m['role'] == 'user'] == ['m1', 'm2', 'm3']
@@ -0,0 +1,77 @@
+"""Per-process cache of logged-in user identities"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+
+class CachedUser(UserMixin):
+    """Detached snapshot of the user fields requests and templates read.
+
+    It carries no database session, so relationships such as
+    ``heart_assessments`` are not available; query by ``user_id`` instead.
+    """
+
+    FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'date_of_birth', 'created_at')
+
+    def __init__(self, user):
+        for field in self.FIELDS:
+            setattr(self, field, getattr(user, field))
+
+    def __repr__(self):
+        return f'<CachedUser {self.id} {self.username!r}>'
+
+
+class UserCache:
+    """TTL + LRU cache of CachedUser snapshots keyed by user id.
+
+    A ``ttl`` of 0 disables caching. Entries are dropped explicitly with
+    ``invalidate`` when the user row changes in this process; changes made
+    by other processes become visible when the entry expires.
+    """
+
+    def __init__(self, ttl=300, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        if self.ttl <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+
+    def put(self, user):
+        """Cache a snapshot of an ORM user and return it"""
+        snapshot = CachedUser(user)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[snapshot.id] = (snapshot, time.monotonic() + self.ttl)
+                self._entries.move_to_end(snapshot.id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
@@ -0,0 +1,26 @@
+"""Production entry point: gevent-cooperative WSGI application
+
+Run with:  gunicorn -c gunicorn.conf.py wsgi:application
+
+gevent turns every blocking socket call into a cooperative yield, so a
+request waiting on the LLM provider costs a greenlet rather than an OS
+thread and one worker process can hold thousands of in-flight AI calls.
+
+Tables, indexes and schema upgrades are set up once by the gunicorn
+master (see on_starting in gunicorn.conf.py), not by each worker.
+"""
+from gevent import monkey
+
+# Must run before anything imports socket, ssl, threading or requests
+monkey.patch_all()
+
+from app import app, check_schema, resume_report_jobs  # noqa: E402
+
+with app.app_context():
+    # Upgrades can drop columns and take minutes, so workers never run them; they only
+    # refuse to boot against a database the master (or deploy step) hasn't upgraded
+    check_schema()
+    # Every worker re-queues pending jobs; claiming a job is atomic, so each still runs once
+    resume_report_jobs()
+
+application = app